@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def _times(df, date_column):
+    lookup = {str(col).lower(): col for col in df.columns}
+    dates = df[lookup[date_column.lower()]]
+    # to_datetime is slow on columns that already hold datetimes
+    if not pd.api.types.is_datetime64_dtype(dates):
+        dates = pd.to_datetime(dates)
+    return dates.to_numpy(dtype='datetime64[ns]')
+
+
+def _merge_times(times, how):
+    if not times:
+        return np.array([], dtype='datetime64[ns]')
+    if how == 'intersection':
+        index = np.unique(times[0])
+        for values in times[1:]:
+            index = np.intersect1d(index, np.unique(values), assume_unique=True)
+        return index
+    return np.unique(np.concatenate(times))
+
+
+def common_index(frames: dict, how: str='union', date_column: str='date'):
+    """
+    Builds the time index to align on
+    :param frames: dict of symbol -> DataFrame with a date column
+    :param how: 'union' for every timestamp any symbol has, 'intersection' for the ones all symbols have
+    :return: sorted DatetimeIndex
+    """
+    return pd.DatetimeIndex(_merge_times([_times(df, date_column) for df in frames.values()], how), name='date')
+
+
+def asof_align(frames: dict, index=None, how: str='union', limit: int=None, max_age=None, date_column: str='date'):
+    """
+    Aligns many symbols onto one time index with sorted-array as-of lookups (one searchsorted per symbol)
+    instead of pairwise merges. Every index time takes the symbol's last bar at or before it. A bar that is
+    carried forward keeps its prices, gets zero volume, and is dropped (NaN) once it is more than `limit`
+    index steps or `max_age` older than the index time.
+    :param frames: dict of symbol -> DataFrame with a date column and OHLCV columns (any capitalization)
+    :param index: DatetimeIndex to align to, e.g. a trading calendar; defaults to common_index(frames, how)
+    :param how: passed to common_index when index is None
+    :param limit: max number of index steps a bar is carried forward, None for no limit
+    :param max_age: max age of a carried bar as a Timedelta or string such as '3D', None for no limit
+    :param date_column: name of the date column
+    :return: (panel, mask, stats); panel is a dict of field -> (symbols x time) float array usable by
+             panel_indicator.compute_panel, mask a (symbols x time) bool array that is True where the symbol had
+             a bar at exactly that time, and stats a DataFrame of gap statistics per symbol
+    """
+    all_times = {symbol: _times(df, date_column) for symbol, df in frames.items()}
+    if index is None:
+        index = pd.DatetimeIndex(_merge_times(list(all_times.values()), how), name='date')
+    grid = pd.DatetimeIndex(index).to_numpy(dtype='datetime64[ns]')
+    symbols = list(frames)
+    n_symbols, n_time = len(symbols), len(grid)
+    max_age = None if max_age is None else pd.Timedelta(max_age).to_timedelta64()
+
+    panel = {}
+    mask = np.zeros((n_symbols, n_time), dtype=bool)
+    stats = []
+    for i, symbol in enumerate(symbols):
+        df = frames[symbol]
+        times = all_times[symbol]
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        # the last bar wins when a timestamp is repeated
+        last = np.concatenate([times[1:] != times[:-1], [True]]) if len(times) else np.array([], dtype=bool)
+        order, times = order[last], times[last]
+
+        source = np.searchsorted(times, grid, side='right') - 1
+        found = source >= 0
+        safe = np.maximum(source, 0)
+        exact = found & (times[safe] == grid) if len(times) else found
+        valid = found.copy()
+        if limit is not None:
+            # index position of the carried bar, or of the first index time after it when it is off grid
+            steps = np.arange(n_time) - np.searchsorted(grid, times[safe], side='left')
+            valid &= steps <= limit
+        if max_age is not None:
+            valid &= (grid - times[safe]) <= max_age
+        mask[i] = exact
+
+        lookup = {str(col).lower(): col for col in df.columns}
+        for field in FIELDS:
+            if field.lower() not in lookup:
+                continue
+            values = df[lookup[field.lower()]].to_numpy(dtype=float)[order]
+            aligned = np.full(n_time, np.nan)
+            aligned[valid] = values[safe[valid]] if len(values) else np.nan
+            if field == 'Volume':
+                aligned[valid & ~exact] = 0
+            if field not in panel:
+                panel[field] = np.full((n_symbols, n_time), np.nan)
+            panel[field][i] = aligned
+
+        # longest run of index times without an exact bar
+        hits = np.flatnonzero(exact)
+        edges = np.concatenate([[-1], hits, [n_time]])
+        longest = int(np.max(np.diff(edges)) - 1) if n_time else 0
+        stats.append({'symbol': symbol, 'bars': len(times), 'on_index': int(exact.sum()),
+                      'coverage': float(exact.mean()) if n_time else np.nan,
+                      'filled': int((valid & ~exact).sum()), 'missing': int((~valid).sum()),
+                      'longest_gap': longest,
+                      'first': pd.Timestamp(times[0]) if len(times) else pd.NaT,
+                      'last': pd.Timestamp(times[-1]) if len(times) else pd.NaT})
+
+    return panel, mask, pd.DataFrame(stats).set_index('symbol')
+
+
+def panel_to_long(panel: dict, symbols: list, index, mask=None):
+    """
+    Returns an aligned panel as a long DataFrame indexed by (symbol, date), e.g. for feature_selector
+    :param mask: optional exact-bar mask from asof_align, added as an 'observed' column
+    """
+    frame = pd.DataFrame({field: values.reshape(-1) for field, values in panel.items()},
+                         index=pd.MultiIndex.from_product([symbols, pd.DatetimeIndex(index)], names=['symbol', 'date']))
+    if mask is not None:
+        frame['observed'] = mask.reshape(-1)
+    return frame
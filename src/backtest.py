@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+
+def signal_columns(df: pd.DataFrame):
+    """
+    Returns the trend deterministic columns of an Indicator frame (names ending in _td)
+    """
+    return [col for col in df.columns if str(col).endswith('_td')]
+
+
+def simple_returns(close):
+    """
+    Close to close returns along the time axis; the first row and rows next to missing prices are 0
+    :param close: array with time on the first axis
+    :return: float array of the same shape
+    """
+    close = np.asarray(close, dtype=float)
+    returns = np.zeros_like(close)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = close[1:] / close[:-1] - 1
+    return np.where(np.isfinite(returns), returns, 0)
+
+
+def combine_signals(signals, weights):
+    """
+    Combines signal columns into many candidate strategies at once: sign of the weighted sum of the signals
+    :param signals: (time x signals) array of -1/0/1 signals
+    :param weights: (signals x combinations) array, e.g. 0/1 columns selecting the signals to vote with
+    :return: (time x combinations) array of -1/0/1 signals
+    """
+    return np.sign(np.nan_to_num(np.asarray(signals, dtype=float)) @ np.asarray(weights, dtype=float))
+
+
+def strategy_returns(close, signals, cost: float=0.0, lag: int=1):
+    """
+    Per bar returns of holding the position given by each signal column
+    :param close: Close prices, shape (time,) or (time x columns) matching signals
+    :param signals: (time x columns) array of -1/0/1 signals; a signal is traded lag bars later
+    :param cost: transaction cost per unit of position change, as a fraction of the price
+    :param lag: bars between a signal and the position it opens (1 trades on the next bar)
+    :return: (returns, positions), both (time x columns) float arrays
+    """
+    signals = np.nan_to_num(np.asarray(signals, dtype=float))
+    if signals.ndim == 1:
+        signals = signals[:, None]
+    returns = simple_returns(close)
+    if returns.ndim == 1:
+        returns = returns[:, None]
+
+    positions = np.zeros_like(signals)
+    if lag < len(signals):
+        positions[lag:] = signals[:len(signals) - lag]
+    changes = np.abs(np.diff(positions, axis=0, prepend=0))
+    return positions*returns - cost*changes, positions
+
+
+def metrics(returns, positions, periods_per_year: int=252):
+    """
+    Standard metrics of each column of strategy returns
+    :param returns: (time x columns) array from strategy_returns
+    :param positions: (time x columns) array from strategy_returns
+    :param periods_per_year: bars per year for the annualized Sharpe ratio
+    :return: dict of metric name -> array with one value per column
+    """
+    n = len(returns)
+    equity = np.cumprod(1 + returns, axis=0)
+    mean = returns.mean(axis=0)
+    std = returns.std(axis=0, ddof=1) if n > 1 else np.zeros(returns.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), 0.0)
+        drawdown = equity / np.maximum.accumulate(np.maximum(equity, 1), axis=0) - 1
+        active = positions != 0
+        hit_rate = ((returns > 0) & active).sum(axis=0) / active.sum(axis=0)
+    return {'total_return': equity[-1] - 1 if n else np.zeros(returns.shape[1]),
+            'annual_return': mean*periods_per_year,
+            'sharpe': sharpe,
+            'max_drawdown': drawdown.min(axis=0) if n else np.zeros(returns.shape[1]),
+            'hit_rate': np.nan_to_num(hit_rate),
+            'exposure': active.mean(axis=0),
+            'trades': (np.diff(positions, axis=0) != 0).sum(axis=0)}
+
+
+def backtest(close, signals, cost: float=0.0005, lag: int=1, periods_per_year: int=252, names: list=None):
+    """
+    Backtests every signal column against one Close series in a single vectorized pass
+    :param close: Close prices, Series or array of shape (time,)
+    :param signals: DataFrame of td columns (e.g. from Indicator(df, td=True).get_df()) or (time x columns) array
+    :param cost: transaction cost per unit of position change
+    :param lag: bars between a signal and the position it opens
+    :param periods_per_year: bars per year, e.g. 252 for daily and 252*78 for 5min bars
+    :param names: column names when signals is an array
+    :return: DataFrame with one row of metrics per signal column
+    """
+    if isinstance(signals, pd.DataFrame):
+        names = list(signals.columns)
+        signals = signals.to_numpy(dtype=float)
+    returns, positions = strategy_returns(np.asarray(close, dtype=float), signals, cost, lag)
+    names = names if names is not None else list(range(returns.shape[1]))
+    return pd.DataFrame(metrics(returns, positions, periods_per_year), index=pd.Index(names, name='signal'))
+
+
+def backtest_panel(close, features, columns: list, symbols: list, cost: float=0.0005, lag: int=1,
+                   periods_per_year: int=252):
+    """
+    Backtests every td column for every symbol of a panel at once
+    :param close: (symbols x time) array of Close prices
+    :param features: (symbols x time x columns) array, e.g. from panel_indicator.compute_panel(..., td=True)
+    :param columns: the feature column names
+    :param symbols: the symbol names
+    :return: DataFrame of metrics indexed by (symbol, signal)
+    """
+    n_symbols, n_time, n_columns = features.shape
+    # every (symbol, signal) pair becomes one column with time on the first axis
+    signals = features.transpose(1, 0, 2).reshape(n_time, n_symbols*n_columns)
+    prices = np.repeat(np.asarray(close, dtype=float).T, n_columns, axis=1)
+    returns, positions = strategy_returns(prices, signals, cost, lag)
+    index = pd.MultiIndex.from_product([symbols, columns], names=['symbol', 'signal'])
+    return pd.DataFrame(metrics(returns, positions, periods_per_year), index=index)
+
+
+def _window_sharpe(cumsum, cumsq, start, stop, periods_per_year):
+    """
+    Sharpe ratio of every column over rows [start, stop) from prefix sums of the returns and squared returns
+    """
+    n = stop - start
+    total = cumsum[stop] - cumsum[start]
+    mean = total / n
+    var = (cumsq[stop] - cumsq[start] - n*mean**2) / max(n - 1, 1)
+    std = np.sqrt(np.maximum(var, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(std > 1e-12, mean / std * np.sqrt(periods_per_year), 0.0)
+
+
+def walk_forward(close, signals, train: int, test: int, step: int=None, cost: float=0.0005, lag: int=1,
+                 periods_per_year: int=252, names: list=None):
+    """
+    Walk-forward evaluation: in every train window the signal column with the best Sharpe ratio is picked and
+    then traded over the following test window. Strategy returns are computed once for all columns and window
+    Sharpe ratios come from prefix sums, so the cost per window is O(columns).
+    :param close: Close prices of shape (time,)
+    :param signals: DataFrame or (time x columns) array of -1/0/1 signals, e.g. from combine_signals
+    :param train: bars in each training window
+    :param test: bars in each test window
+    :param step: bars between window starts, defaults to test; with step < test a window is traded until the
+                 next window starts, so no bar is counted twice in the stitched returns
+    :return: (windows, out_of_sample) where windows is a DataFrame with the chosen signal and its train and
+             test Sharpe ratio per window, and out_of_sample a DataFrame of metrics of the stitched test returns,
+             including the cost of switching signals at window boundaries
+    """
+    if isinstance(signals, pd.DataFrame):
+        names = list(signals.columns)
+        signals = signals.to_numpy(dtype=float)
+    returns, positions = strategy_returns(np.asarray(close, dtype=float), signals, cost, lag)
+    names = names if names is not None else list(range(returns.shape[1]))
+    step = step or test
+    zeros = np.zeros((1, returns.shape[1]))
+    cumsum = np.concatenate([zeros, np.cumsum(returns, axis=0)])
+    cumsq = np.concatenate([zeros, np.cumsum(returns**2, axis=0)])
+
+    rows = []
+    chosen = []
+    for start in range(0, len(returns) - train - test + 1, step):
+        split, stop = start + train, start + train + test
+        train_sharpe = _window_sharpe(cumsum, cumsq, start, split, periods_per_year)
+        best = int(np.argmax(train_sharpe))
+        test_sharpe = _window_sharpe(cumsum, cumsq, split, stop, periods_per_year)
+        rows.append({'train_start': start, 'test_start': split, 'test_stop': stop, 'signal': names[best],
+                     'train_sharpe': train_sharpe[best], 'test_sharpe': test_sharpe[best]})
+        chosen.append((split, stop, best))
+
+    # with step < test the test windows overlap, each one is only traded until the next one starts
+    oos_returns = []
+    oos_positions = []
+    previous = None
+    for i, (split, stop, best) in enumerate(chosen):
+        stop = min(stop, chosen[i + 1][0]) if i + 1 < len(chosen) else stop
+        segment_returns = returns[split:stop, best].copy()
+        segment_positions = positions[split:stop, best]
+        if previous is not None:
+            # the column's own return charged the change from its own previous position, the stitched
+            # strategy changes from the position held by the previous window's signal
+            own = positions[split - 1, best] if split else 0.0
+            segment_returns[0] += cost*(abs(segment_positions[0] - own) - abs(segment_positions[0] - previous))
+        previous = segment_positions[-1]
+        oos_returns.append(segment_returns)
+        oos_positions.append(segment_positions)
+
+    windows = pd.DataFrame(rows, columns=['train_start', 'test_start', 'test_stop', 'signal', 'train_sharpe', 'test_sharpe'])
+    if not rows:
+        return windows, pd.DataFrame()
+    stitched = metrics(np.concatenate(oos_returns)[:, None], np.concatenate(oos_positions)[:, None], periods_per_year)
+    return windows, pd.DataFrame(stitched, index=pd.Index(['walk_forward'], name='signal'))
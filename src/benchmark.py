@@ -0,0 +1,300 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from indicator import Indicator
+
+
+INDICATOR_METHODS = ['sma', 'wma', 'momentum', 'stochastic_k', 'stochastic_d', 'rsi', 'stochatic_r', 'ad', 'cci']
+
+
+def make_ohlcv(rows: int, seed: int=0):
+    """
+    Generates a synthetic OHLCV DataFrame with a random walk Close column
+    :param rows: number of bars
+    :param seed: random seed
+    :return: DataFrame with Close, High, Low, Volume columns
+    """
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, rows))
+    return pd.DataFrame({'Close': close,
+                         'High': close + rng.random(rows),
+                         'Low': close - rng.random(rows),
+                         'Volume': rng.integers(1, 10000, rows).astype(float)})
+
+
+# ///////////////////////////// Loop implementations the vectorized Indicator methods replaced ////////////////////////////
+
+def legacy_wma(df, n=5, td=False):
+    denom = n*(n+1)/2
+    closes = list(df['Close'])
+    means = []
+    for i in range(len(closes)):
+        if n < i < len(closes)-n:
+            mean = closes[i]
+        else:
+            mean = sum(closes[i-n:i])/denom
+        means.append(mean)
+    if not td:
+        return np.array(means)
+    means.insert(0, 0)
+    return np.sign(np.diff(np.array(means)))
+
+
+def legacy_cci(df, period=20, td=False):
+    temp = np.array([(x+y+z)/3 for x,y,z in zip(df['Close'], df['High'], df['Low'])])
+    sma = pd.DataFrame(temp, columns=['tempvar'])['tempvar'].rolling(window=period, min_periods=1).mean()
+    dev = [abs(x-y) for x,y in zip(temp,sma)]
+    means = []
+    for i in range(len(dev)):
+        if 10 <= i <= len(dev)-10:
+            mean = sum(dev[i-10:i+11])/21
+        else:
+            mean = dev[i]
+        means.append(mean)
+    ccis = [(x-y)/(0.015*z) for x,y,z in zip(temp,sma,means)]
+    if not td:
+        return np.array(ccis)
+    vals = []
+    for i, values in enumerate(ccis):
+        if values >= 200:
+            vals.append(-1)
+        elif values <= -200:
+            vals.append(1)
+        elif i > 0:
+            vals.append(-1 if values > ccis[i-1] else 1 if values < ccis[i-1] else 0)
+        else:
+            vals.append(1)
+    return np.array(vals)
+
+
+def legacy_rsi_td(df, period=14):
+    delta = df['Close'].diff()
+    rs = delta.where(delta > 0, 0).rolling(window=period, min_periods=1).mean() / (-delta.where(delta < 0, 0)).rolling(window=period, min_periods=1).mean()
+    rsi = (100 - (100/(1 + rs))).to_numpy()
+    vals = []
+    for i, value in enumerate(rsi):
+        if value <= 30:
+            vals.append(1)
+        elif value >= 70:
+            vals.append(-1)
+        elif i > 0:
+            vals.append(-1 if value > rsi[i-1] else 1 if value < rsi[i-1] else 0)
+        else:
+            vals.append(1)
+    return np.array(vals)
+
+
+def legacy_momentum_td(df, n=7):
+    temp = df['Close'] - df['Close'].shift(n).fillna(0)
+    return np.array([1 if i > 0 else -1 if i < 0 else 0 for i in temp])
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def compare_vectorized(sizes=(10_000, 100_000, 1_000_000)):
+    """
+    Times the loop and vectorized versions of wma, cci and the td signal paths and checks they agree
+    :param sizes: row counts to benchmark
+    :return: DataFrame with one row per (rows, method)
+    """
+    cases = [('wma', False, {'n': 5}, legacy_wma, {'n': 5, 'td': False}),
+             ('wma', True, {'n': 5}, legacy_wma, {'n': 5, 'td': True}),
+             ('cci', False, {'period': 20}, legacy_cci, {'period': 20, 'td': False}),
+             ('cci', True, {'period': 20}, legacy_cci, {'period': 20, 'td': True}),
+             ('rsi', True, {'period': 14}, legacy_rsi_td, {'period': 14}),
+             ('momentum', True, {'n': 7}, legacy_momentum_td, {'n': 7})]
+    results = []
+    for rows in sizes:
+        df = make_ohlcv(rows)
+        for method, td, params, legacy, legacy_params in cases:
+            legacy_time, expected = timed(legacy, df, **legacy_params)
+            indicator = Indicator(df.copy(), td=td)
+            new_time, _ = timed(getattr(indicator, method), **params)
+            actual = indicator.get_df().iloc[:, -1].to_numpy()
+            results.append({'rows': rows,
+                            'method': f'{method}_td' if td else method,
+                            'loop_s': legacy_time,
+                            'vectorized_s': new_time,
+                            'speedup': legacy_time / new_time,
+                            'identical': np.array_equal(expected, actual, equal_nan=True)})
+    return pd.DataFrame(results)
+
+
+def compare_boruta(rows: int=2000, noise_columns: int=5, seed: int=0):
+    """
+    Compares wall time and selected features of Boruta_py and Boruta_fast on synthetic indicator features
+    plus pure noise columns
+    :param rows: number of bars
+    :param noise_columns: number of random columns that should be rejected
+    :return: DataFrame with one row per implementation
+    """
+    from feature_selector import Boruta_py, Boruta_fast
+    from feature_pipeline import FeaturePipeline
+
+    pipeline = FeaturePipeline([{'name': 'sma', 'periods': [5, 20]}, {'name': 'wma'}, {'name': 'momentum'},
+                                {'name': 'stochastic_k'}, {'name': 'stochastic_d'}, {'name': 'rsi'},
+                                {'name': 'stochatic_r'}, {'name': 'ad'}, {'name': 'cci'}])
+    df = pipeline.run(make_ohlcv(rows, seed)).drop(columns=['High', 'Low', 'Volume'])
+    rng = np.random.default_rng(seed)
+    for i in range(noise_columns):
+        df[f'noise_{i}'] = rng.normal(size=rows)
+
+    results = []
+    selected = {}
+    for name, func in [('Boruta_py', Boruta_py), ('Boruta_fast', Boruta_fast)]:
+        elapsed, (_, ranking) = timed(func, df)
+        selected[name] = np.asarray(ranking) == 1
+        results.append({'method': name, 'seconds': elapsed, 'confirmed': int(selected[name].sum())})
+    agreement = float(np.mean(selected['Boruta_py'] == selected['Boruta_fast']))
+    for result in results:
+        result['agreement'] = agreement
+    return pd.DataFrame(results)
+
+
+# ///////////////////////////////////////////// Benchmark suite /////////////////////////////////////////////
+
+def measure(func, repeat: int=3):
+    """
+    Times func (best of repeat runs) and measures its peak traced memory in a separate run
+    :param func: zero argument callable; called repeat + 1 times
+    :return: (seconds, peak bytes)
+    """
+    best = np.inf
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            best = min(best, timed(func)[0])
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def _record(results, name, func, rows, repeat):
+    seconds, peak = measure(func, repeat)
+    results[name] = {'seconds': seconds, 'rows_per_sec': rows / seconds if seconds else None, 'peak_mb': peak / 2**20}
+    print(f'{name:<36} {seconds:10.4f}s {rows / seconds if seconds else 0:14,.0f} rows/s {peak / 2**20:10.1f} MB')
+
+
+def run_suite(rows: int=100_000, symbols: int=1, repeat: int=3, boruta_rows: int=2000, boruta_py: bool=False, seed: int=0):
+    """
+    Times the hot paths on synthetic data without touching the FMP api: every Indicator method in both td modes,
+    PCA, Boruta and the summary functions
+    :param rows: bars per symbol
+    :param symbols: number of synthetic symbols
+    :param repeat: timing runs per case (the best is kept)
+    :param boruta_rows: rows used for the Boruta cases, which are far slower than the rest
+    :param boruta_py: also time the original BorutaPy selector
+    :param seed: random seed of the first symbol
+    :return: dict with 'meta' and 'results' (name -> seconds, rows_per_sec, peak_mb)
+    """
+    from feature_pipeline import FeaturePipeline
+    from feature_selector import principalca, Boruta_fast, Boruta_py
+    from summarize_stock import summarize_dataframe, summarize_chunks
+
+    frames = [make_ohlcv(rows, seed + i) for i in range(symbols)]
+    total = rows * symbols
+    results = {}
+
+    for td in [False, True]:
+        for method in INDICATOR_METHODS:
+            def run_method():
+                for df in frames:
+                    getattr(Indicator(df.copy(), td=td), method)()
+            _record(results, f'indicator.{method}{"_td" if td else ""}', run_method, total, repeat)
+
+    pipeline = FeaturePipeline([{'name': name} for name in INDICATOR_METHODS])
+    features = [pipeline.run(df).drop(columns=['High', 'Low', 'Volume']) for df in frames]
+    feature_table = pd.concat(features, ignore_index=True)
+    _record(results, 'feature_pipeline.run', lambda: [pipeline.run(df) for df in frames], total, repeat)
+    _record(results, 'feature_selector.principalca', lambda: principalca(feature_table, n=4), total, repeat)
+
+    boruta_table = feature_table.iloc[:boruta_rows]
+    _record(results, 'feature_selector.Boruta_fast', lambda: Boruta_fast(boruta_table), len(boruta_table), 1)
+    if boruta_py:
+        _record(results, 'feature_selector.Boruta_py', lambda: Boruta_py(boruta_table), len(boruta_table), 1)
+
+    _record(results, 'summarize_stock.summarize_dataframe', lambda: summarize_dataframe(feature_table), len(feature_table), repeat)
+    chunk = max(len(feature_table) // 10, 1)
+    _record(results, 'summarize_stock.summarize_chunks',
+            lambda: summarize_chunks(feature_table.iloc[i:i + chunk] for i in range(0, len(feature_table), chunk)),
+            len(feature_table), repeat)
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    meta = {'commit': commit, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'rows': rows, 'symbols': symbols,
+            'repeat': repeat, 'boruta_rows': boruta_rows, 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine()}
+    return {'meta': meta, 'results': results}
+
+
+def compare_results(baseline: dict, current: dict, threshold: float=0.1):
+    """
+    Compares two run_suite outputs
+    :param baseline: results of the reference commit
+    :param current: results to check
+    :param threshold: allowed relative slowdown before a case counts as a regression
+    :return: DataFrame with one row per case present in both
+    """
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        base = baseline['results'][name]
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] else np.inf
+        rows.append({'case': name, 'baseline_s': base['seconds'], 'current_s': result['seconds'], 'ratio': ratio,
+                     'peak_mb_change': result['peak_mb'] - base['peak_mb'], 'regression': ratio > 1 + threshold})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks of the indicator, feature selection and summary code')
+    commands = parser.add_subparsers(dest='command')
+    suite = commands.add_parser('suite', help='run the benchmark suite and write the results as json')
+    suite.add_argument('--rows', type=int, default=100_000)
+    suite.add_argument('--symbols', type=int, default=1)
+    suite.add_argument('--repeat', type=int, default=3)
+    suite.add_argument('--boruta-rows', type=int, default=2000)
+    suite.add_argument('--boruta-py', action='store_true')
+    suite.add_argument('--out', default='bench_results.json')
+    compare = commands.add_parser('compare', help='compare two suite json files')
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=0.1)
+    commands.add_parser('vectorized', help='loop vs vectorized Indicator methods')
+    commands.add_parser('boruta', help='Boruta_py vs Boruta_fast')
+    args = parser.parse_args()
+
+    if args.command == 'suite':
+        output = run_suite(args.rows, args.symbols, args.repeat, args.boruta_rows, args.boruta_py)
+        with open(args.out, 'w') as file:
+            json.dump(output, file, indent=2)
+        print('Results written to', args.out)
+    elif args.command == 'compare':
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        with open(args.current) as file:
+            current = json.load(file)
+        report = compare_results(baseline, current, args.threshold)
+        print(report.to_string(index=False))
+        sys.exit(1 if report['regression'].any() else 0)
+    elif args.command == 'boruta':
+        print(compare_boruta().to_string(index=False))
+    else:
+        print(compare_vectorized().to_string(index=False))
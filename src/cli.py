@@ -0,0 +1,238 @@
+import argparse
+import os
+import sys
+import time
+import system_check
+# every other module is imported inside the command that needs it, so e.g. fetch never loads sklearn
+
+
+def _read_frame(path: str):
+    import pandas as pd
+    return pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+
+
+def _write_frame(df, path: str):
+    if path is None:
+        print(df)
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith('.parquet'):
+        df.to_parquet(path)
+    else:
+        df.to_csv(path, index=df.index.name is not None)
+    print('Written to', path)
+
+
+def _ohlcv(df):
+    """
+    Renames FMP price columns to the Indicator names and sorts the rows by date
+    """
+    from indicator import ohlcv_columns
+    renamed = ohlcv_columns(df)
+    if 'date' in renamed.columns:
+        renamed = renamed.sort_values('date', kind='stable').reset_index(drop=True)
+    return renamed
+
+
+def _features(df, config_path: str, td: bool=None):
+    from feature_pipeline import FeaturePipeline
+    pipeline = FeaturePipeline.from_config(config_path)
+    if td is not None:
+        pipeline.specs = [(name, period, td, k_period) for name, period, _, k_period in pipeline.specs]
+    return pipeline.run(_ohlcv(df))
+
+
+def fetch(args):
+    """
+    Downloads the price history of one or more symbols
+    """
+    import pandas as pd
+    from extract_data import template_fields
+    config_path = system_check.config_path(args.config)
+    fromdate, todate = args.fromdate, args.todate
+    if {'from_date', 'to_date'} <= template_fields(config_path, args.freq):
+        # the template needs a date range, default to the last year
+        todate = todate or pd.Timestamp.now().strftime('%Y-%m-%d')
+        fromdate = fromdate or (pd.Timestamp(todate) - pd.DateOffset(years=1)).strftime('%Y-%m-%d')
+    requests = [(symbol, args.freq, fromdate, todate) for symbol in args.symbols]
+    if args.cache_dir:
+        from price_cache import fetch_with_cache
+        try:
+            frames = fetch_with_cache(requests, config_path, args.key, args.cache_dir, max_workers=args.max_workers)
+        except ValueError as error:
+            print('Error:', error)
+            return 1
+    else:
+        from extract_data import construct_urls, get_jsonparsed_data_batch, read_json_frame
+        urls = [construct_urls(config_path=config_path, key_name=args.key, data_freq=freq, fromdate=start,
+                               todate=end, symbol=symbol) for symbol, freq, start, end in requests]
+        outputs = get_jsonparsed_data_batch(urls, max_workers=args.max_workers, parser=read_json_frame)
+        frames = [output[1] if output is not None else None for output in outputs]
+
+    fetched = {symbol: df for (symbol, *_), df in zip(requests, frames) if df is not None}
+    for symbol, *_ in requests:
+        if symbol not in fetched:
+            print('Error fetching data for:', symbol)
+    if not fetched:
+        return 1
+    if args.out is None:
+        for symbol, df in fetched.items():
+            print('Current Stock:', symbol)
+            print(df.head(10))
+        return 0
+    frame = pd.concat(fetched, names=['symbol', None]).reset_index(level=0)
+    _write_frame(frame.reset_index(drop=True), args.out)
+    return 0
+
+
+def features(args):
+    """
+    Calculates the config's indicator features for a price file
+    """
+    config_path = system_check.config_path(args.config)
+    df = _features(_read_frame(args.input), config_path, True if args.td else None)
+    _write_frame(df, args.out)
+    return 0
+
+
+def select(args):
+    """
+    Runs feature selection (PCA or Boruta) on a feature file
+    """
+    import numpy as np
+    import pandas as pd
+    import feature_selector
+    df = _read_frame(args.input).select_dtypes('number')
+    if args.method == 'pca':
+        components = feature_selector.principalca(df, n=args.n, model_path=args.model_path)
+        _write_frame(components, args.out)
+        return 0
+    if args.method == 'boruta':
+        _, ranking = feature_selector.Boruta_py(df)
+    else:
+        _, ranking = feature_selector.Boruta_fast(df, max_iter=args.max_iter, cache_dir=args.cache_dir)
+    result = pd.DataFrame({'ranking': np.asarray(ranking), 'selected': np.asarray(ranking) == 1},
+                          index=pd.Index(df.columns.drop('Close'), name='feature')).sort_values('ranking')
+    _write_frame(result, args.out)
+    return 0
+
+
+def summarize(args):
+    """
+    Fetches and summarizes every stock of the portfolio
+    """
+    from summarize_stock import summarize_stock
+    summarize_stock(system_check.portfolio_path(args.portfolio), by_column=args.by_column,
+                    max_workers=args.max_workers, rate_limit=args.rate_limit, cache_dir=args.cache_dir,
+                    config_path=args.config)
+    return 0
+
+
+def backtest(args):
+    """
+    Backtests the trend deterministic signal of every configured indicator on a price file
+    """
+    import backtest as bt
+    config_path = system_check.config_path(args.config)
+    df = _features(_read_frame(args.input), config_path, td=True)
+    result = bt.backtest(df['Close'], df[bt.signal_columns(df)], cost=args.cost, lag=args.lag,
+                         periods_per_year=args.periods_per_year)
+    _write_frame(result.sort_values('sharpe', ascending=False), args.out)
+    return 0
+
+
+def plot(args):
+    """
+    Renders decimated price and indicator charts into plots/
+    """
+    from plotting import render_charts
+    frames = {}
+    for path in args.inputs:
+        df = _read_frame(path)
+        if 'symbol' in df.columns:
+            # a multi-symbol file as written by fetch --out
+            frames.update({symbol: group.drop(columns='symbol') for symbol, group in df.groupby('symbol', sort=False)})
+        else:
+            frames[os.path.splitext(os.path.basename(path))[0]] = df
+    paths = render_charts(frames, args.columns, plots_dir=args.plots_dir, width=args.width, height=args.height,
+                          method=args.method, fmt=args.fmt, max_workers=args.max_workers)
+    for symbol, path in paths.items():
+        print(f'{symbol}: {path}')
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='trading', description='Fetch prices, build features, select features, '
+                                     'summarize the portfolio, backtest signals and plot charts')
+    parser.add_argument('--config', default=None,
+                        help='config_file.yml path, defaults to $TRADING_CONFIG or config/config_file.yml')
+    parser.add_argument('--timing', action='store_true', help='print the start up and run time')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('fetch', help='download price history')
+    command.add_argument('symbols', nargs='+')
+    command.add_argument('--freq', default='eod', help='request name in the config, e.g. eod, 5min, forex_light')
+    command.add_argument('--from', dest='fromdate', default=None, help='first date, defaults to a year before --to')
+    command.add_argument('--to', dest='todate', default=None, help='last date, defaults to today')
+    command.add_argument('--key', default='stock_key', help='api key name in the config')
+    command.add_argument('--cache-dir', default=None, help='parquet cache folder, only missing ranges are requested')
+    command.add_argument('--max-workers', type=int, default=8)
+    command.add_argument('--out', default=None, help='.csv or .parquet file, prints the data when omitted')
+    command.set_defaults(run=fetch)
+
+    command = commands.add_parser('features', help='calculate the configured indicator features')
+    command.add_argument('input', help='.csv or .parquet price file')
+    command.add_argument('--td', action='store_true', help='trend deterministic signals instead of values')
+    command.add_argument('--out', default=None)
+    command.set_defaults(run=features)
+
+    command = commands.add_parser('select', help='feature selection on a feature file')
+    command.add_argument('input', help='.csv or .parquet feature file with a Close column')
+    command.add_argument('--method', choices=['boruta_fast', 'boruta', 'pca'], default='boruta_fast')
+    command.add_argument('--n', type=int, default=8, help='number of principal components')
+    command.add_argument('--model-path', default=None, help='where to save the fitted scaler and PCA')
+    command.add_argument('--max-iter', type=int, default=100)
+    command.add_argument('--cache-dir', default=None, help='Boruta_fast ranking cache folder')
+    command.add_argument('--out', default=None)
+    command.set_defaults(run=select)
+
+    command = commands.add_parser('summarize', help='fetch and summarize the portfolio')
+    command.add_argument('--portfolio', default=None, help='defaults to $TRADING_PORTFOLIO or portfolio.csv')
+    command.add_argument('--by-column', action='store_true')
+    command.add_argument('--max-workers', type=int, default=8)
+    command.add_argument('--rate-limit', type=float, default=None)
+    command.add_argument('--cache-dir', default=None)
+    command.set_defaults(run=summarize)
+
+    command = commands.add_parser('backtest', help='backtest the td signals of the configured indicators')
+    command.add_argument('input', help='.csv or .parquet price file')
+    command.add_argument('--cost', type=float, default=0.0005)
+    command.add_argument('--lag', type=int, default=1)
+    command.add_argument('--periods-per-year', type=int, default=252)
+    command.add_argument('--out', default=None)
+    command.set_defaults(run=backtest)
+
+    command = commands.add_parser('plot', help='render decimated price and indicator charts')
+    command.add_argument('inputs', nargs='+', help='.csv or .parquet price files, one per symbol or with a symbol column')
+    command.add_argument('--columns', nargs='*', default=[], help='indicator columns to draw, e.g. sma_20 rsi_14')
+    command.add_argument('--method', choices=['minmax', 'lttb'], default='minmax')
+    command.add_argument('--width', type=int, default=1600)
+    command.add_argument('--height', type=int, default=900)
+    command.add_argument('--fmt', default='png')
+    command.add_argument('--plots-dir', default=None, help='defaults to the plots folder')
+    command.add_argument('--max-workers', type=int, default=None)
+    command.set_defaults(run=plot)
+    return parser
+
+
+def main(argv: list=None):
+    start = time.perf_counter()
+    args = build_parser().parse_args(argv)
+    status = args.run(args)
+    if args.timing:
+        print(f'{args.command} finished in {time.perf_counter() - start:.3f} s, modules loaded: {len(sys.modules)}')
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+
+def align_returns(frames: dict, column: str='close', how: str='inner', date_column: str='date'):
+    """
+    Puts the close to close returns of many symbols on one date index
+    :param frames: dict of symbol -> DataFrame with a date column and a price column
+    :param column: price column, matched case-insensitively so FMP and Indicator frames both work
+    :param how: 'inner' keeps the dates every symbol has, 'ffill' keeps all dates and carries prices forward
+    :param date_column: name of the date column
+    :return: (dates, symbols, returns) with returns a (time x symbols) float64 array without NaNs
+    """
+    prices = {}
+    for symbol, df in frames.items():
+        lookup = {str(col).lower(): col for col in df.columns}
+        series = pd.Series(df[lookup[column.lower()]].to_numpy(dtype=float),
+                           index=pd.to_datetime(df[lookup[date_column.lower()]]))
+        prices[symbol] = series[~series.index.duplicated(keep='last')].sort_index()
+    wide = pd.concat(prices, axis=1, join='inner' if how == 'inner' else 'outer').sort_index()
+    if how == 'ffill':
+        wide = wide.ffill().dropna()
+    returns = wide.pct_change().iloc[1:]
+    return returns.index, list(wide.columns), returns.to_numpy(dtype=float)
+
+
+def _output(shape, out):
+    if out is None:
+        return np.empty(shape, dtype=np.float32)
+    return np.lib.format.open_memmap(out, mode='w+', dtype=np.float32, shape=shape)
+
+
+def _finish(cov, corr):
+    """
+    Turns a stack of covariance matrices into correlations when corr is set
+    """
+    if not corr:
+        return cov
+    std = np.sqrt(np.einsum('tii->ti', cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cov / (std[:, :, None]*std[:, None, :])
+
+
+def rolling_cov(returns, window: int, min_periods: int=None, corr: bool=False, step: int=1, out: str=None,
+                resync: int=None):
+    """
+    Rolling covariance (or correlation) matrices of all symbols from running sums. The sums of x and of the
+    outer products x x^T are updated by adding the rows entering the window and removing the rows leaving it,
+    so a step costs O(N^2) however long the window is; with step > 1 the rows in between are added with one
+    matrix product. The sums are recomputed from the window every `resync` rows to keep rounding from drifting.
+    :param returns: (time x symbols) array, e.g. from align_returns
+    :param window: rows in each window
+    :param min_periods: rows needed for a value, defaults to window; earlier matrices are NaN
+    :param corr: return correlations instead of covariances
+    :param step: keep every step-th matrix only (the last row of each step)
+    :param out: optional .npy path; the result is then written to a memory mapped file
+    :param resync: rows between exact recomputations of the sums, defaults to 50 windows
+    :return: (time // step x symbols x symbols) float32 array
+    """
+    x = np.asarray(returns, dtype=float)
+    n_time, n_symbols = x.shape
+    min_periods = window if min_periods is None else max(min_periods, 2)
+    resync = resync or 50*window
+    kept = np.arange(step - 1, n_time, step)
+    result = _output((len(kept), n_symbols, n_symbols), out)
+
+    sum_outer = np.zeros((n_symbols, n_symbols))
+    sum_x = np.zeros(n_symbols)
+    done = 0
+    last_sync = 0
+    for position, row in enumerate(kept):
+        stop = row + 1
+        if stop - last_sync >= resync:
+            first = max(stop - window, 0)
+            sum_outer = x[first:stop].T @ x[first:stop]
+            sum_x = x[first:stop].sum(axis=0)
+            last_sync = stop
+        else:
+            added = x[done:stop]
+            removed = x[max(done - window, 0):max(stop - window, 0)]
+            sum_outer += added.T @ added - removed.T @ removed
+            sum_x += added.sum(axis=0) - removed.sum(axis=0)
+        done = stop
+
+        count = min(stop, window)
+        if count < min_periods:
+            result[position] = np.nan
+            continue
+        cov = (sum_outer - np.outer(sum_x, sum_x)/count) / (count - 1)
+        result[position] = _finish(cov[None], corr)[0]
+    return result
+
+
+def ewm_cov(returns, halflife: float=None, alpha: float=None, corr: bool=False, step: int=1, out: str=None,
+            bias: bool=False):
+    """
+    Exponentially weighted covariance (or correlation) matrices, updated in O(N^2) per row:
+    mean += alpha*d and cov = (1 - alpha)*(cov + alpha*d d^T) with d the deviation from the previous mean.
+    This is the biased covariance, pandas' ewm(alpha=alpha, adjust=False).cov(bias=True). With bias=False
+    (the pandas default) it is scaled by 1 / (1 - sum of squared weights), which matches
+    ewm(alpha=alpha, adjust=False).cov(); correlations are the same either way.
+    :param returns: (time x symbols) array, e.g. from align_returns
+    :param halflife: decay half life in rows (alternative to alpha)
+    :param alpha: smoothing factor in (0, 1]
+    :param corr: return correlations instead of covariances
+    :param step: keep every step-th matrix only
+    :param out: optional .npy path for a memory mapped result
+    :param bias: return the biased covariance instead of the unbiased one
+    :return: (time // step x symbols x symbols) float32 array; the first matrix is NaN (all zeros with bias)
+    """
+    if alpha is None:
+        if halflife is None:
+            raise ValueError('Either halflife or alpha is needed')
+        alpha = 1 - np.exp(np.log(0.5) / halflife)
+    x = np.asarray(returns, dtype=float)
+    n_time, n_symbols = x.shape
+    kept = np.arange(step - 1, n_time, step)
+    result = _output((len(kept), n_symbols, n_symbols), out)
+
+    mean = x[0].copy() if n_time else np.zeros(n_symbols)
+    cov = np.zeros((n_symbols, n_symbols))
+    # sum of the squared (normalized) observation weights, for the debiasing factor
+    sum_weights2 = 1.0
+    position = 0
+    for t in range(n_time):
+        if t:
+            d = x[t] - mean
+            mean += alpha*d
+            cov = (1 - alpha)*(cov + alpha*np.outer(d, d))
+            sum_weights2 = (1 - alpha)**2*sum_weights2 + alpha**2
+        if position < len(kept) and kept[position] == t:
+            if bias or corr:
+                result[position] = _finish(cov[None], corr)[0]
+            elif sum_weights2 < 1:
+                result[position] = cov / (1 - sum_weights2)
+            else:
+                result[position] = np.nan
+            position += 1
+    return result
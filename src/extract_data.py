@@ -1,7 +1,18 @@
 import certifi
 import json
+import os
+import re
 import yaml
-from system_check import check_system
+import ssl
+import string
+import time
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import system_check
+from instrumentation import stage, profiled
+import numpy as np
 import pandas as pd
 
 try:
@@ -9,13 +20,159 @@ try:
 except ImportError:
     print('Error: Could not import urlopen from urllib.request')   
 
+# orjson parses large payloads several times faster than json when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 def get_jsonparsed_data(url: str):
     '''
     Function that fetches the data from request url
     '''
     response = urlopen(url, cafile=certifi.where())
-    data = response.read().decode("utf-8")
-    return json.loads(data)
+    data = response.read()
+    return _loads(data)
+
+
+class RateLimiter:
+    '''
+    Spaces out requests made with the same api key so that at most `rate` requests are started per second
+    '''
+
+    def __init__(self, rate: float=None):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, key: str):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(key, now))
+            self.next_slot[key] = slot + 1.0/self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HTTPStatusError(http.client.HTTPException):
+    '''
+    A response other than 200; retryable for 429 and 5xx, which are usually temporary
+    '''
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self):
+        return self.status == 429 or self.status >= 500
+
+
+class ConnectionPool:
+    '''
+    Keeps one keep-alive connection per host for each worker thread
+    '''
+
+    def __init__(self, timeout: float=30):
+        self.timeout = timeout
+        self.local = threading.local()
+        self.context = ssl.create_default_context(cafile=certifi.where())
+        self.opened = []
+
+    def get(self, scheme: str, host: str):
+        conns = self.local.__dict__.setdefault('conns', {})
+        conn = conns.get((scheme, host))
+        if conn is None:
+            if scheme == 'https':
+                conn = http.client.HTTPSConnection(host, timeout=self.timeout, context=self.context)
+            else:
+                conn = http.client.HTTPConnection(host, timeout=self.timeout)
+            conns[(scheme, host)] = conn
+            self.opened.append(conn)
+        return conn
+
+    def drop(self, scheme: str, host: str):
+        conns = self.local.__dict__.setdefault('conns', {})
+        conn = conns.pop((scheme, host), None)
+        if conn is not None:
+            conn.close()
+
+    def request(self, url: str):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        conn = self.get(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', path, headers={'Connection': 'keep-alive'})
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            # the server may have closed an idle connection, next attempt reconnects
+            self.drop(parts.scheme, parts.netloc)
+            raise
+        if response.will_close:
+            self.drop(parts.scheme, parts.netloc)
+        if response.status != 200:
+            raise HTTPStatusError(response.status, f'{response.status} {response.reason} for {parts.path}')
+        return data
+
+    def close(self):
+        for conn in self.opened:
+            conn.close()
+        self.opened = []
+
+
+def get_jsonparsed_data_batch(urls: list, max_workers: int=8, rate_limit: float=None, retries: int=3, backoff: float=0.5, timeout: float=30, parser=None):
+    '''
+    Fetches the data from many request urls concurrently over keep-alive connections
+    :param urls: list of request urls, as returned by construct_urls
+    :param max_workers: number of worker threads
+    :param rate_limit: max requests started per second for each api key (None for no limit)
+    :param retries: number of retries for connection errors, 429 and 5xx responses; other 4xx fail at once
+    :param backoff: base delay in seconds, doubled after each failed attempt
+    :param timeout: socket timeout in seconds
+    :param parser: function applied to each response body, defaults to parsing the json;
+                   read_json_frame returns (symbol, DataFrame) pairs instead
+    :return: list of parsed responses in the same order as urls, None where the fetch failed
+    '''
+    parser = parser or _loads
+    pool = ConnectionPool(timeout=timeout)
+    limiter = RateLimiter(rate_limit)
+
+    def fetch(url):
+        query = parse_qs(urlsplit(url).query)
+        key = query.get('apikey', [''])[0]
+        symbol = query.get('symbol', [urlsplit(url).path.rsplit('/', 1)[-1]])[0]
+        for attempt in range(retries + 1):
+            limiter.wait(key)
+            try:
+                with stage('fetch', symbol=symbol, attempt=attempt) as info:
+                    body = pool.request(url)
+                    info['bytes'] = len(body)
+                return parser(body)
+            except KeyError as error:
+                print('Unexpected response from:', urlsplit(url).path, error)
+                return None
+            except (http.client.HTTPException, OSError, ValueError) as error:
+                # a bad key (401) or an unknown symbol (404) fails the same way on every attempt
+                if attempt == retries or (isinstance(error, HTTPStatusError) and not error.retryable):
+                    print('Error fetching data from:', urlsplit(url).path, error)
+                    return None
+                time.sleep(backoff * 2**attempt)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(fetch, urls))
+    finally:
+        pool.close()
 
 
 def read_json_data(json_data):
@@ -29,6 +186,205 @@ def read_json_data(json_data):
         return '', pd.DataFrame(json_data)
 
 
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+def _skip(text, pos):
+    return _WHITESPACE.match(text, pos).end()
+
+
+def _records_to_columns(records, kinds, dtype):
+    """
+    Converts a batch of row dicts to one typed array per key; kinds maps key -> 'date', 'float' or 'object'
+    """
+    if kinds is None:
+        kinds = {}
+        for key, value in records[0].items():
+            if key == 'date':
+                kinds[key] = 'date'
+            elif value is None or isinstance(value, (int, float)):
+                kinds[key] = 'float'
+            else:
+                kinds[key] = 'object'
+    columns = {}
+    for key, kind in kinds.items():
+        if kind == 'date':
+            columns[key] = pd.to_datetime([row[key] for row in records]).to_numpy(dtype='datetime64[ns]')
+        elif kind == 'float':
+            # None becomes nan
+            columns[key] = np.array([row.get(key) for row in records], dtype=dtype)
+        else:
+            columns[key] = np.array([row.get(key) for row in records], dtype=object)
+    return kinds, columns
+
+
+def _read_records(text, pos, dtype, batch_size):
+    """
+    Decodes the json array of rows starting at text[pos] a batch at a time, converting every batch to typed
+    arrays so only one batch of row dicts is alive at a time. A batch is cut at a closing brace and parsed with
+    one json.loads call; when the cut lands inside a string value the rows are decoded one by one instead.
+    :return: (dict of column -> array, position after the array)
+    """
+    if text[pos] != '[':
+        raise ValueError(f'Expected a json array at position {pos}')
+    kinds, chunks = None, []
+    pos = _skip(text, pos + 1)
+    row_chars = None
+    while text[pos] != ']':
+        batch = None
+        if row_chars is not None:
+            end = text.find('}', pos + batch_size*row_chars)
+            if end >= 0:
+                try:
+                    batch = json.loads('[' + text[pos:end + 1] + ']')
+                    pos = end + 1
+                except ValueError:
+                    batch = None
+        if batch is None:
+            start, batch = pos, []
+            while text[pos] != ']' and len(batch) < batch_size:
+                row, pos = _DECODER.raw_decode(text, pos)
+                batch.append(row)
+                pos = _skip(text, pos)
+                if text[pos] == ',':
+                    pos = _skip(text, pos + 1)
+            row_chars = max((pos - start) // len(batch), 1)
+        kinds, columns = _records_to_columns(batch, kinds, dtype)
+        chunks.append(columns)
+        pos = _skip(text, pos)
+        if text[pos] == ',':
+            pos = _skip(text, pos + 1)
+    if not chunks:
+        return {}, pos + 1
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in kinds}, pos + 1
+
+
+@profiled('parse', result_rows=lambda output: len(output[1]))
+def read_json_frame(raw, dtype=np.float64, batch_size: int=16384):
+    """
+    Parses a response body straight into a typed DataFrame, the columnar counterpart of read_json_data.
+    Dates become datetime64 and numeric fields use dtype. With orjson installed the body is parsed in one go,
+    otherwise the rows are decoded incrementally so peak memory stays close to the size of the final frame.
+    :param raw: response body as bytes or str, either {'symbol': ..., 'historical': [...]} or a list of rows
+    :param dtype: float dtype of the numeric columns
+    :param batch_size: rows converted to arrays at a time
+    :return: (symbol, DataFrame); symbol is '' for list payloads
+    """
+    if orjson is not None:
+        json_data = orjson.loads(raw)
+        if isinstance(json_data, dict):
+            symbol, records = json_data['symbol'], json_data['historical']
+        else:
+            symbol, records = '', json_data
+        columns = {}
+        kinds = None
+        for start in range(0, len(records), batch_size):
+            kinds, chunk = _records_to_columns(records[start:start + batch_size], kinds, dtype)
+            for key, values in chunk.items():
+                columns.setdefault(key, []).append(values)
+        return symbol, pd.DataFrame({key: np.concatenate(values) for key, values in columns.items()}, copy=False)
+
+    text = raw.decode('utf-8') if isinstance(raw, bytes) else raw
+    pos = _skip(text, 0)
+    if text[pos] == '[':
+        return '', pd.DataFrame(_read_records(text, pos, dtype, batch_size)[0], copy=False)
+
+    symbol, columns = None, None
+    pos = _skip(text, pos + 1)
+    while text[pos] != '}':
+        key, pos = _DECODER.raw_decode(text, pos)
+        pos = _skip(text, _skip(text, pos) + 1)
+        if key == 'historical':
+            columns, pos = _read_records(text, pos, dtype, batch_size)
+        else:
+            value, pos = _DECODER.raw_decode(text, pos)
+            if key == 'symbol':
+                symbol = value
+        pos = _skip(text, pos)
+        if text[pos] == ',':
+            pos = _skip(text, pos + 1)
+    if symbol is None:
+        raise KeyError('symbol')
+    if columns is None:
+        raise KeyError('historical')
+    return symbol, pd.DataFrame(columns, copy=False)
+
+
+_config_lock = threading.Lock()
+_config_cache = {}
+
+
+def load_config(config_path: str):
+    """
+    Loads the yaml config file, re-reading it only when its modification time or size changes.
+    The returned dict is shared between callers and must not be modified.
+    :param config_path: path to the yaml config file
+    :return: dict of the config
+    """
+    stat = os.stat(config_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _config_lock:
+        cached = _config_cache.get(config_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+    with open(config_path,'r') as file:
+        config = yaml.safe_load(file)
+    with _config_lock:
+        _config_cache[config_path] = (stamp, config, {})
+    return config
+
+
+def _compiled_template(config_path: str, data_freq: str):
+    """
+    Splits the request template for data_freq into (literal, field) parts once per loaded config
+    """
+    config = load_config(config_path)
+    with _config_lock:
+        templates = _config_cache[config_path][2]
+        if data_freq not in templates:
+            templates[data_freq] = [(literal, field) for literal, field, _, _ in string.Formatter().parse(config['requests'][data_freq])]
+        return templates[data_freq]
+
+
+def template_fields(config_path: str, data_freq: str):
+    """
+    Returns the names of the fields in the request template for data_freq, e.g. {'symbol', 'from_date', 'to_date', 'key'}
+    """
+    return {field for _, field in _compiled_template(config_path, data_freq) if field is not None}
+
+
+def construct_urls_frame(portfolio_df: pd.DataFrame, config_path: str, key_name: str):
+    """
+    Constructs the request url of every portfolio row in one call; rows are grouped by freq and each
+    group is built with vectorized string concatenation from the compiled template
+    :param portfolio_df: portfolio DataFrame as returned by read_portfolio
+    :param config_path: path to the yaml config file
+    :param key_name: the key in the config file holding the api key
+    :return: Series of urls aligned with portfolio_df
+    """
+    config = load_config(config_path)
+    columns = config['columns']
+    symbols = portfolio_df[columns['stock_symbol']].astype(str)
+    values = {'symbol': symbols, 'currencies': symbols,
+              'from_date': portfolio_df[columns['from']].astype(str),
+              'to_date': portfolio_df[columns['to']].astype(str)}
+    api_key = str(config['keys'][key_name])
+
+    urls = pd.Series('', index=portfolio_df.index, dtype=object)
+    freqs = portfolio_df[columns['freq']].astype(str)
+    for data_freq, rows in freqs.groupby(freqs).groups.items():
+        url = pd.Series('', index=rows, dtype=object)
+        for literal, field in _compiled_template(config_path, data_freq):
+            url = url + literal
+            if field == 'key':
+                url = url + api_key
+            elif field is not None:
+                url = url + values[field].loc[rows]
+        urls.loc[rows] = url
+    return urls
+
+
 def construct_urls(config_path: str=None, key_name: str=None, data_freq: str=None, fromdate: str=None, todate: str=None, symbol: str = None):
     """
     Constructs API request URLs based on the provided configuration and parameters.
@@ -39,7 +395,6 @@ def construct_urls(config_path: str=None, key_name: str=None, data_freq: str=Non
         config_path (str): Path to the YAML configuration file.
         key_name (str): The key in the config file to retrieve the API key.
         data_freq (str): The type of data to request (e.g., 'forex', 'forex_list', 'forex_light', or others).
-        ticker_name (list, optional): List of ticker names to construct URLs for (used for non-forex data).
         fromdate (str, optional): Start date for data extraction (format depends on API).
         todate (str, optional): End date for data extraction (format depends on API).
         currency (str, optional): Currency pair or code (used for forex data).
@@ -58,8 +413,7 @@ def construct_urls(config_path: str=None, key_name: str=None, data_freq: str=Non
         )
     """
 
-    with open(config_path,'r') as file:
-        config = yaml.safe_load(file)
+    config = load_config(config_path)
 
     final_urls = []
     api_key = config['keys'][key_name]
@@ -97,18 +451,14 @@ def construct_urls(config_path: str=None, key_name: str=None, data_freq: str=Non
 
 if __name__ == "__main__":
 
-    # Check the system type to ensure correct paths
-    if check_system() == 'macOS':
-        config_path = '/Users/macbook/Mirror/trading_algorithm/config/config_file.yml'
-
-    else:
-        config_path = 'C:\\Users\\viren\\DSML projects\\trading_alg\\config\\config_file.yml'
+    # config path from TRADING_CONFIG or the project's config folder
+    config_path = system_check.config_path()
 
     # Define parameters
     fromdate = '2024-11-04'
     todate = '2025-02-05'
 
-    final_url = construct_urls(config_path=config_path, key_name='stock_key',data_freq='forex_light', ticker_name=['apple'], fromdate=fromdate, todate=todate, symbol='EURUSD')
+    final_url = construct_urls(config_path=config_path, key_name='stock_key',data_freq='forex_light', fromdate=fromdate, todate=todate, symbol='EURUSD')
 
     json_data_output = get_jsonparsed_data(final_url)
 
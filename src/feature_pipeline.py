@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+from instrumentation import profiled
+from indicator import BASE_COLUMNS, _oscillator_td, _wma_values, _cci_from_typical
+
+
+DEFAULT_PERIODS = {'sma': 5, 'wma': 5, 'momentum': 7, 'stochastic_k': 14, 'stochastic_d': 3,
+                   'rsi': 14, 'stochatic_r': 14, 'cci': 20}
+
+
+COLUMN_PREFIXES = {'k': 'stochastic_k', 'd': 'stochastic_d', 'r': 'stochatic_r'}
+
+
+def parse_column(column: str):
+    """
+    Inverse of FeaturePipeline.columns: 'rsi_14_td' -> ('rsi', 14, True), 'k_14' -> ('stochastic_k', 14, False)
+    :param column: feature column name
+    :return: (indicator name, period, td)
+    """
+    td = column.endswith('_td')
+    base = column[:-3] if td else column
+    if base == 'ad':
+        return 'ad', None, td
+    name, _, period = base.rpartition('_')
+    name = COLUMN_PREFIXES.get(name, name)
+    if name not in DEFAULT_PERIODS or not period.isdigit():
+        raise ValueError(f'Unknown indicator column: {column}')
+    return name, int(period), td
+
+
+def _fillna(values):
+    return np.where(np.isnan(values), 0, values)
+
+
+def _diff_sign(values):
+    """
+    np.sign(series.diff().fillna(0))
+    """
+    return np.sign(_fillna(np.diff(values, prepend=np.nan)))
+
+
+class FeaturePipeline:
+    '''Builds a declared set of Indicator features, computing every shared intermediate only once.
+
+    Each feature and intermediate is a node keyed by a tuple, e.g. ('lowest_low', 14) or ('k', 14). Nodes are
+    resolved on demand and memoized, so the dependencies form a DAG that is evaluated once per run: the Close
+    diff is shared by every rsi, the rolling extrema by stochastic_k, stochastic_d and stochatic_r of the
+    same period, and stochastic_d reads k% directly so it no longer has to run after stochastic_k.
+    Columns are named and valued like the Indicator methods.
+
+    Attributes:
+        specs (list): (name, period, td, k_period) tuples, one per feature column.
+
+    Methods:
+        from_config(config_path): Builds the pipeline from the 'features' section of the config file.
+        columns(): Returns the output column names.
+        compute(data): Returns the features for a dict of column arrays.
+        run(df): Returns df with the feature columns added.
+        '''
+
+    def __init__(self, indicators: list, td: bool=False):
+        """
+        :param indicators: list of dicts with 'name', optional 'periods' list, optional 'td' flag and for
+                           stochastic_d an optional 'k_period', e.g. {'name': 'sma', 'periods': [5, 20]}
+        :param td: default td flag for entries without one
+        """
+        self.specs = []
+        for entry in indicators:
+            name = entry['name']
+            periods = entry.get('periods', [DEFAULT_PERIODS.get(name)])
+            for period in periods:
+                self.specs.append((name, period, entry.get('td', td), entry.get('k_period', 14)))
+        self.nodes = {}
+
+    @classmethod
+    def from_config(cls, config_path: str=None):
+        # the cached loader; imported here so the pipeline does not load the http client
+        import system_check
+        from extract_data import load_config
+        config = load_config(system_check.config_path(config_path))
+        return cls(config['features']['indicators'], td=config['features'].get('td', False))
+
+    def columns(self):
+        names = []
+        for name, period, td, _ in self.specs:
+            base = {'stochastic_k': f'k_{period}', 'stochastic_d': f'd_{period}', 'stochatic_r': f'r_{period}',
+                    'ad': 'ad'}.get(name, f'{name}_{period}')
+            names.append(f'{base}_td' if td else base)
+        return names
+
+    # ////////////////////////////////// Intermediate nodes ///////////////////////////////////////
+
+    def seed(self, data: dict):
+        """
+        Sets the base columns the nodes are calculated from and drops every memoized node
+        :param data: dict of column name -> 1d float array for Close, High, Low and Volume
+        """
+        self.nodes = {(column,): values for column, values in data.items()}
+
+    def node(self, key):
+        if key not in self.nodes:
+            self.nodes[key] = getattr(self, f'_node_{key[0]}')(*key[1:])
+        return self.nodes[key]
+
+    def _rolling(self, column, window, min_periods):
+        return pd.Series(self.node((column,))).rolling(window=window, min_periods=min_periods)
+
+    def _node_sma_close(self, n):
+        return self._rolling('Close', n, 1).mean().to_numpy()
+
+    def _node_delta(self):
+        return np.diff(self.node(('Close',)), prepend=np.nan)
+
+    def _node_rs(self, period):
+        delta = self.node(('delta',))
+        gains = pd.Series(np.where(delta > 0, delta, 0)).rolling(window=period, min_periods=1).mean()
+        losses = pd.Series(-np.where(delta < 0, delta, 0)).rolling(window=period, min_periods=1).mean()
+        return (gains / losses).to_numpy()
+
+    def _node_lowest_low(self, period):
+        return self._rolling('Low', period, 7).min().to_numpy()
+
+    def _node_highest_high(self, period):
+        return self._rolling('High', period, 7).max().to_numpy()
+
+    def _node_range(self, period):
+        return self.node(('highest_high', period)) - self.node(('lowest_low', period))
+
+    def _node_k(self, period):
+        return 100 * ((self.node(('Close',)) - self.node(('lowest_low', period))) / self.node(('range', period)))
+
+    def _node_typical(self):
+        return (self.node(('Close',)) + self.node(('High',)) + self.node(('Low',)))/3
+
+    def _node_ad(self):
+        high, low = self.node(('High',)), self.node(('Low',))
+        mfv = self.node(('Volume',)) * (((2*self.node(('Close',))) - high - low) / (high - low))
+        return pd.Series(mfv).cumsum().to_numpy()
+
+    # ////////////////////////////////// Feature nodes ///////////////////////////////////////
+
+    def feature(self, name, period, td, k_period):
+        close = self.node(('Close',))
+        if name == 'sma':
+            sma = self.node(('sma_close', period))
+            return np.sign(close - sma) if td else sma
+        if name == 'wma':
+            means = _wma_values(close, period)
+            return np.sign(np.diff(means, prepend=0)) if td else means
+        if name == 'momentum':
+            past = pd.Series(close).shift(period).fillna(0).to_numpy()
+            values = close - past
+            return np.select([values > 0, values < 0], [1, -1], 0) if td else values
+        if name == 'stochastic_k':
+            k = self.node(('k', period))
+            return _diff_sign(k) if td else _fillna(k)
+        if name == 'stochastic_d':
+            d = pd.Series(self.node(('k', k_period))).rolling(window=period).mean().to_numpy()
+            return _diff_sign(d) if td else _fillna(d)
+        if name == 'rsi':
+            rsi = 100 - (100/(1 + self.node(('rs', period))))
+            return _oscillator_td(rsi, 30, 70) if td else _fillna(rsi)
+        if name == 'stochatic_r':
+            highest = self.node(('highest_high', period))
+            if td:
+                return _diff_sign((highest - close)/self.node(('range', period)))
+            return _fillna(100*(highest - close)/self.node(('range', period)))
+        if name == 'ad':
+            ad = self.node(('ad',))
+            return _diff_sign(ad) if td else ad
+        if name == 'cci':
+            ccis = _cci_from_typical(self.node(('typical',)), period)
+            return _oscillator_td(ccis, -200, 200) if td else ccis
+        raise ValueError(f'Unknown indicator: {name}')
+
+    @profiled('FeaturePipeline.compute', rows=lambda self, data: len(data['Close']))
+    def compute(self, data: dict):
+        """
+        Calculates every declared feature from plain arrays
+        :param data: dict of column name -> 1d float array for Close, High, Low and Volume
+        :return: dict of feature column -> array
+        """
+        self.seed(data)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features = {col: self.feature(*spec) for col, spec in zip(self.columns(), self.specs)}
+        self.nodes = {}
+        return features
+
+    @profiled('FeaturePipeline.run', rows=lambda self, df: len(df))
+    def run(self, df: pd.DataFrame):
+        """
+        Calculates every declared feature for df
+        :param df: DataFrame with Close, High, Low and Volume columns
+        :return: a new DataFrame with df's columns followed by the feature columns
+        """
+        data = {column: df[column].to_numpy(dtype=float) for column in BASE_COLUMNS if column in df.columns}
+        features = self.compute(data)
+        return pd.concat([df, pd.DataFrame(features, index=df.index)], axis=1)
@@ -1,37 +1,136 @@
-from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.ensemble import RandomForestRegressor
 import pandas as pd
-from boruta import BorutaPy
 import numpy as np
+import joblib
+import contextlib
+import hashlib
+import json
+import os
+from instrumentation import profiled
+# sklearn, boruta and scipy are imported inside the functions that use them, they take over a second to import
 # pd.set_option('display.max_columns', None)
 
 
-def principalca(df, n=8):
+@profiled(rows=lambda df, *args, **kwargs: len(df))
+def principalca(df, n=8, model_path=None, verbose=False):
     """
     Performs Principal Component Analysis on the DataFrame.
     :param df: The DataFrame to perform PCA on.
     :param n: Number of components to return.
+    :param model_path: If given, the fitted scaler and PCA are saved there for transform_pca.
+    :param verbose: Print the first principal components and the explained variance.
     :return: The DataFrame with the principal components.
     """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import PCA
     df = df.fillna(0)
-    x = df.drop('Close',axis=1).values
+    columns = df.columns.drop('Close')
+    x = df[columns].values
     sc = StandardScaler()
     scaled_x = sc.fit_transform(x)
-    del x, sc, df
+    del x, df
 
     pca = PCA(n_components=n)
     principal_components = pca.fit_transform(scaled_x)
     principal_df = pd.DataFrame(data=principal_components,columns=[f'pc{i+1}' for i in range(np.shape(principal_components)[1])])
 
-    print('The principal components: ')
-    print(principal_df.head(10))
+    if verbose:
+        print('The principal components: ')
+        print(principal_df.head(10))
     print(f'The explained variance from {n} components is {pca.explained_variance_ratio_}')
-    del pca
+    if model_path is not None:
+        joblib.dump({'scaler': sc, 'pca': pca, 'columns': list(columns)}, model_path)
+    del pca, sc
 
     return principal_df
 
 
+def _iter_chunks(chunks):
+    """
+    Yields DataFrames from a callable returning an iterable of DataFrames, or from a list of DataFrames
+    and parquet/csv file paths
+    """
+    if callable(chunks):
+        chunks = chunks()
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = pd.read_parquet(chunk) if chunk.endswith('.parquet') else pd.read_csv(chunk)
+        yield chunk
+
+
+@profiled()
+def principalca_incremental(chunks, n=8, model_path=None):
+    """
+    Fits the scaler and PCA of principalca chunk by chunk, for feature sets that do not fit in memory.
+    The chunks are read twice, once to fit the scaler and once to fit the components.
+    :param chunks: A callable returning an iterable of feature DataFrames (e.g. a generator function),
+                   or a list of DataFrames / parquet or csv file paths.
+    :param n: Number of components.
+    :param model_path: If given, the fitted scaler and PCA are saved there for transform_pca.
+    :return: dict with the fitted 'scaler', 'pca' and the feature 'columns'
+    """
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.decomposition import IncrementalPCA
+    sc = StandardScaler()
+    columns = None
+    for chunk in _iter_chunks(chunks):
+        columns = chunk.columns.drop('Close')
+        sc.partial_fit(chunk[columns].fillna(0).values)
+
+    # IncrementalPCA needs at least n rows per batch, short chunks are carried over to the next one
+    pca = IncrementalPCA(n_components=n)
+    carry = None
+    for chunk in _iter_chunks(chunks):
+        scaled_x = sc.transform(chunk[columns].fillna(0).values)
+        if carry is not None:
+            scaled_x = np.vstack([carry, scaled_x])
+        if len(scaled_x) < n:
+            carry = scaled_x
+            continue
+        pca.partial_fit(scaled_x)
+        carry = None
+    if carry is not None:
+        print(f'Skipped the last {len(carry)} rows, fewer than {n} rows left for a batch')
+
+    print(f'The explained variance from {n} components is {pca.explained_variance_ratio_}')
+    model = {'scaler': sc, 'pca': pca, 'columns': list(columns)}
+    if model_path is not None:
+        joblib.dump(model, model_path)
+    return model
+
+
+@profiled(rows=lambda df, *args, **kwargs: len(df))
+def transform_pca(df, model):
+    """
+    Projects new data onto fitted principal components without refitting.
+    :param df: The feature DataFrame, with or without the Close column.
+    :param model: dict returned by principalca_incremental, or a path saved by principalca / principalca_incremental
+    :return: The DataFrame with the principal components.
+    """
+    if isinstance(model, str):
+        model = joblib.load(model)
+    x = df[model['columns']].fillna(0).values
+    principal_components = model['pca'].transform(model['scaler'].transform(x))
+    return pd.DataFrame(data=principal_components, columns=[f'pc{i+1}' for i in range(np.shape(principal_components)[1])], index=df.index)
+
+
+@contextlib.contextmanager
+def _numpy_aliases():
+    """
+    BorutaPy still uses np.int, np.float and np.bool, which numpy removed. The aliases are added for the duration
+    of the fit only and removed again, so other code never sees them.
+    """
+    added = [name for name in ('int', 'float', 'bool') if name not in np.__dict__]
+    for name, alias in [('int', np.int32), ('float', np.float64), ('bool', np.bool_)]:
+        if name in added:
+            setattr(np, name, alias)
+    try:
+        yield
+    finally:
+        for name in added:
+            delattr(np, name)
+
+
+@profiled(rows=lambda df, *args, **kwargs: len(df))
 def Boruta_py(df, n_estimators='auto', random_state=69420, max_depth=5):
     """
     Performs Boruta feature selection on the DataFrame.
@@ -41,24 +140,117 @@ def Boruta_py(df, n_estimators='auto', random_state=69420, max_depth=5):
     :param max_depth: The maximum depth of the Random Forest Regressor.
     :return: The DataFrame with the selected features.
     """
-    np.int = np.int32
-    np.float = np.float64
-    np.bool = np.bool_
+    from sklearn.ensemble import RandomForestRegressor
+    from boruta import BorutaPy
     df = df.fillna(0)
     x = df.drop('Close', axis=1).values
     y = df['Close'].values
     del df
     rf = RandomForestRegressor(n_jobs=-1, max_depth=max_depth)
     feature_selector = BorutaPy(rf, n_estimators=n_estimators, verbose=1, random_state=random_state)
-    feature_selector.fit(x,y)
+    with _numpy_aliases():
+        feature_selector.fit(x,y)
+        return1 = feature_selector.transform(x)
     del rf, y
     print(feature_selector.support_)
     print(feature_selector.ranking_)
-    return1 = feature_selector.transform(x)
     ranking = feature_selector.ranking_
     return (return1, ranking)
 
 
+def _boruta_estimator(backend, n_estimators, max_depth, random_state):
+    """
+    Returns the tree ensemble used by Boruta_fast; 'auto' uses LightGBM's histogram trees when installed
+    """
+    if backend in ('auto', 'lightgbm'):
+        try:
+            from lightgbm import LGBMRegressor
+            return LGBMRegressor(n_estimators=n_estimators, max_depth=max_depth, importance_type='gain',
+                                 subsample=0.8, subsample_freq=1, colsample_bytree=0.8,
+                                 random_state=random_state, n_jobs=-1, verbose=-1)
+        except ImportError:
+            if backend == 'lightgbm':
+                raise
+    from sklearn.ensemble import RandomForestRegressor
+    return RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=random_state, n_jobs=-1)
+
+
+@profiled(rows=lambda df, *args, **kwargs: len(df))
+def Boruta_fast(df, max_iter=100, subsample=0.5, alpha=0.05, backend='auto', n_estimators=100, max_depth=5,
+                random_state=69420, cache_dir=None):
+    """
+    Performs Boruta feature selection with row subsampling, early stopping and cached results.
+    Each iteration fits the trees on a random subsample of the rows, with every undecided or confirmed feature and
+    a shuffled shadow copy of each. A feature scores a hit when its importance beats the best shadow. Features are
+    confirmed or rejected by a Bonferroni corrected binomial test on the hits, rejected ones are dropped from later
+    iterations, and the loop stops once no feature is tentative.
+    :param df: The DataFrame to perform Boruta on.
+    :param max_iter: The maximum number of iterations.
+    :param subsample: Fraction of the rows used in each iteration.
+    :param alpha: Significance level of the hit tests.
+    :param backend: 'auto', 'lightgbm' or 'random_forest'.
+    :param n_estimators: The number of trees per iteration.
+    :param max_depth: The maximum depth of the trees.
+    :param random_state: The random state.
+    :param cache_dir: If given, rankings are cached there keyed by a hash of the data and parameters.
+    :return: The selected features and the ranking (1 confirmed, 2 tentative, 3+ rejected), like Boruta_py.
+    """
+    from scipy import stats
+    df = df.fillna(0)
+    x = df.drop('Close', axis=1).values
+    y = df['Close'].values
+    del df
+
+    params = [max_iter, subsample, alpha, backend, n_estimators, max_depth, random_state]
+    cache_path = None
+    if cache_dir is not None:
+        key = hashlib.sha256()
+        key.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+        key.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+        key.update(json.dumps(params + list(x.shape)).encode())
+        cache_path = os.path.join(cache_dir, f'boruta_{key.hexdigest()[:20]}.joblib')
+        if os.path.exists(cache_path):
+            support, ranking = joblib.load(cache_path)
+            return (x[:, support], ranking)
+
+    rng = np.random.default_rng(random_state)
+    n_rows, n_features = x.shape
+    hits = np.zeros(n_features)
+    decision = np.zeros(n_features, dtype=int)  # 1 confirmed, 0 tentative, -1 rejected
+    n_iter = 0
+    for n_iter in range(1, max_iter + 1):
+        active = np.flatnonzero(decision >= 0)
+        rows = rng.choice(n_rows, size=max(int(subsample*n_rows), 1), replace=False)
+        real = x[np.ix_(rows, active)]
+        shadow = rng.permuted(real, axis=0)
+        estimator = _boruta_estimator(backend, n_estimators, max_depth, int(rng.integers(2**31)))
+        estimator.fit(np.hstack([real, shadow]), y[rows])
+        importances = estimator.feature_importances_
+        hits[active] += importances[:len(active)] > importances[len(active):].max()
+
+        tentative = decision == 0
+        accept = stats.binom.sf(hits - 1, n_iter, .5) <= alpha / n_features
+        reject = stats.binom.cdf(hits, n_iter, .5) <= alpha / n_features
+        decision[tentative & accept] = 1
+        decision[tentative & reject] = -1
+        if not np.any(decision == 0):
+            break
+
+    ranking = np.where(decision == 1, 1, 2)
+    rejected = np.flatnonzero(decision == -1)
+    # rejected features are ranked by their hits, most hits first
+    ranking[rejected] = 3 + np.argsort(np.argsort(-hits[rejected], kind='stable'), kind='stable')
+    support = decision == 1
+    print(f'Boruta_fast finished after {n_iter} iterations: {support.sum()} confirmed, {np.sum(decision == 0)} tentative')
+    print(support)
+    print(ranking)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        joblib.dump((support, ranking), cache_path)
+    return (x[:, support], ranking)
+
+
 # def get_importances(X, y):
 #     rf = RandomForestRegressor(max_depth=20)
 #     rf.fit(X,y)
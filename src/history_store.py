@@ -0,0 +1,136 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from indicator import OHLCV_NAMES, ohlcv_columns
+
+
+# stored under the Indicator names so frame() can go straight into Indicator
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+INDEX_FILE = 'index.json'
+
+
+def _column_path(store_dir: str, column: str):
+    return os.path.join(store_dir, f'{column}.bin')
+
+
+def _read_index(store_dir: str):
+    path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {'columns': {}, 'symbols': {}}
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def write_history(store_dir: str, frames: dict, columns: list=None, dtype=np.float64):
+    """
+    Appends price histories to the store. Every column is one flat binary file shared by all symbols and
+    index.json maps each symbol to its (offset, length) in those files. Writing a symbol again points the
+    index at the new rows; the old rows stay in the files until the store is rebuilt.
+    :param store_dir: folder holding the column files and the index
+    :param frames: dict of symbol -> DataFrame with a 'date' column and the price columns, FMP (open, close, ...)
+                   or Indicator (Open, Close, ...) names
+    :param columns: price columns to store in Indicator names, defaults to PRICE_COLUMNS (ignored once the
+                    store has columns)
+    :param dtype: float dtype of the price columns
+    :return: None
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    index = _read_index(store_dir)
+    if not index['columns']:
+        index['columns'] = {'date': 'datetime64[ns]'}
+        index['columns'].update({column: np.dtype(dtype).str for column in (columns or PRICE_COLUMNS)})
+    total = max([offset + length for offset, length in index['symbols'].values()], default=0)
+
+    # rows past the indexed total are left over from an interrupted write and get overwritten
+    files = {}
+    for column in index['columns']:
+        path = _column_path(store_dir, column)
+        files[column] = open(path, 'r+b' if os.path.exists(path) else 'wb')
+        files[column].seek(total*np.dtype(index['columns'][column]).itemsize)
+    try:
+        for symbol, df in frames.items():
+            df = ohlcv_columns(df).assign(date=pd.to_datetime(df['date'])).sort_values('date')
+            for column, column_dtype in index['columns'].items():
+                values = df[column].to_numpy(dtype=column_dtype)
+                files[column].write(values.tobytes())
+            index['symbols'][symbol] = [total, len(df)]
+            total += len(df)
+    finally:
+        for file in files.values():
+            file.truncate()
+            file.close()
+
+    path = os.path.join(store_dir, INDEX_FILE)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(index, file)
+    os.replace(path + '.tmp', path)
+
+
+class HistoryStore:
+    '''Read side of the binary history store written by write_history.
+
+    The column files are memory mapped when first used, and symbols and date ranges are returned as slices of
+    those maps, so opening a large universe only reads the index and nothing is copied until the data is used.
+    The arrays are read only.
+
+    Attributes:
+        store_dir (str): Folder holding the column files and index.json.
+        columns (dict): Column name -> dtype string.
+        offsets (dict): Symbol -> (offset, length) in the column files.
+
+    Methods:
+        symbols(): Returns the stored symbols.
+        arrays(symbol, start=None, end=None, columns=None): Returns memory mapped column slices for a symbol.
+        frame(symbol, start=None, end=None, columns=None): Returns the slices as a DataFrame indexed by date.
+        '''
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        index = _read_index(store_dir)
+        self.columns = index['columns']
+        self.offsets = {symbol: tuple(entry) for symbol, entry in index['symbols'].items()}
+        self.maps = {}
+
+    def symbols(self):
+        return list(self.offsets)
+
+    def _map(self, column):
+        if column not in self.maps:
+            path = _column_path(self.store_dir, column)
+            if os.path.getsize(path) == 0:
+                self.maps[column] = np.empty(0, dtype=self.columns[column])
+            else:
+                # a plain ndarray view slices faster than the memmap subclass
+                self.maps[column] = np.memmap(path, dtype=self.columns[column], mode='r').view(np.ndarray)
+        return self.maps[column]
+
+    def arrays(self, symbol: str, start: str=None, end: str=None, columns: list=None):
+        """
+        Returns the stored columns of one symbol without copying
+        :param symbol: the symbol to load
+        :param start: first date to include (inclusive), None for the start of the history
+        :param end: last date to include (inclusive), None for the end of the history
+        :param columns: columns to return, defaults to all price columns
+        :return: dict of column -> read only array, including 'date'
+        """
+        offset, length = self.offsets[symbol]
+        dates = self._map('date')[offset:offset + length]
+        first = 0 if start is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), side='left'))
+        last = length if end is None else int(np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), side='right'))
+        columns = columns or [column for column in self.columns if column != 'date']
+        arrays = {'date': dates[first:last]}
+        for column in columns:
+            arrays[column] = self._map(column)[offset + first:offset + last]
+        return arrays
+
+    def frame(self, symbol: str, start: str=None, end: str=None, columns: list=None):
+        """
+        Returns one symbol's history as a DataFrame backed by the memory maps, with the Indicator column names
+        (stores written with FMP names are renamed too), so Indicator(store.frame(symbol)) reads the maps directly
+        :return: DataFrame indexed by date
+        """
+        arrays = self.arrays(symbol, start, end, columns)
+        dates = pd.DatetimeIndex(arrays.pop('date'), name='date')
+        arrays = {OHLCV_NAMES.get(column, column): values for column, values in arrays.items()}
+        return pd.DataFrame(arrays, index=dates, copy=False)
@@ -1,6 +1,127 @@
 import pandas as pd
 # pd.set_option('display.max_columns', None)
 import numpy as np
+import functools
+import hashlib
+import inspect
+from instrumentation import profiled
+
+
+def _window_sum(values, starts, stops, width):
+    """
+    sums values[start:stop] along the first axis for each (start, stop) pair, adding left to right like the builtin sum
+    :param values: array with time on the first axis
+    :param starts: array of window starts
+    :param stops: array of window stops
+    :param width: the longest window length
+    :return: array of window sums
+    """
+    sums = np.zeros((len(starts),) + values.shape[1:])
+    last = max(len(values) - 1, 0)
+    for k in range(width):
+        pos = starts + k
+        take = (pos < stops).reshape((-1,) + (1,)*(values.ndim - 1))
+        sums += np.where(take, values[np.minimum(pos, last)], 0)
+    return sums
+
+
+def _oscillator_td(values, lower, upper):
+    """
+    trend deterministic signal of an oscillator: 1 at or below lower, -1 at or above upper, otherwise
+    -1 when rising, 1 when falling and 0 when flat; the first row is 1
+    :param values: array of oscillator values with time on the first axis
+    :return: int array of -1/0/1 signals
+    """
+    values = np.asarray(values, dtype=float)
+    prev = np.roll(values, 1, axis=0)
+    first = np.zeros(values.shape, dtype=bool)
+    first[:1] = True
+    return np.select([values <= lower, values >= upper, first, values > prev, values < prev], [1, -1, 1, -1, 1], 0)
+
+
+def _wma_values(closes, n):
+    """
+    wma kernel on an array with time on the first axis (one column per symbol for 2d input)
+    :param closes: float array of Close prices
+    :param n: window length
+    :return: array of the same shape
+    """
+    denom = n*(n+1)/2
+    length = len(closes)
+    rows = np.arange(length)
+    means = closes.copy()
+    # rows outside (n, length-n) take the sum of closes[i-n:i], with python slice semantics for i < n
+    edge = rows[(rows <= n) | (rows >= length - n)]
+    starts = edge - n
+    starts = np.where(starts < 0, starts + length, starts).clip(min=0)
+    means[edge] = _window_sum(closes, starts, edge, n) / denom
+    return means
+
+
+def _cci_values(close, high, low, period):
+    """
+    cci kernel on arrays with time on the first axis (one column per symbol for 2d input)
+    :param close: float array of Close prices
+    :param high: float array of High prices
+    :param low: float array of Low prices
+    :param period: window of the typical price moving average
+    :return: array of the same shape
+    """
+    return _cci_from_typical((close + high + low)/3, period)
+
+
+def _cci_from_typical(temp, period):
+    """
+    cci kernel on the typical price (close + high + low)/3
+    """
+    sma = pd.DataFrame(temp).rolling(window=period, min_periods=1).mean().to_numpy().reshape(temp.shape)
+    dev = np.abs(temp - sma)
+    # mean deviation over the 21 rows centred on each row; the first and last rows keep their own deviation
+    count = max(len(dev) - 19, 0)
+    padded = np.concatenate([dev, np.zeros((1,) + dev.shape[1:])])
+    sums = np.zeros((count,) + dev.shape[1:])
+    for k in range(21):
+        sums += padded[k:k + count]
+    means = dev.copy()
+    means[10:10 + count] = sums / 21
+    return (temp - sma)/(0.015*means)
+
+
+# FMP payload columns -> Indicator columns; the light endpoints only have a price
+# the price columns the indicators are calculated from
+BASE_COLUMNS = ['Close', 'High', 'Low', 'Volume']
+
+OHLCV_NAMES = {'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close', 'price': 'Close', 'volume': 'Volume'}
+
+
+def ohlcv_columns(df):
+    """
+    Renames FMP price columns (open, high, low, close or price, volume) to the Indicator names without copying
+    the data; frames that already use the Indicator names are returned unchanged
+    """
+    renames = {col: OHLCV_NAMES[str(col).lower()] for col in df.columns
+               if str(col).lower() in OHLCV_NAMES and col != OHLCV_NAMES[str(col).lower()]}
+    return df.rename(columns=renames) if renames else df
+
+
+def _indicator_rows(self, *args, **kwargs):
+    return len(self.df)
+
+
+def _registers(method):
+    """
+    In lazy mode an indicator method call only registers its column; it is calculated when first accessed
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.lazy:
+            return method(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        self.register(method.__name__, *list(bound.arguments.values())[1:])
+    return wrapper
 
 
 class Indicator:
@@ -12,6 +133,12 @@ class Indicator:
         imp_features (None): Placeholder for storing important features.
         k (None): Placeholder for storing stochastic k% values.
         inter (DataFrame): Intermediate DataFrame for storing temporary calculations.
+        compact (bool): A flag indicating whether features go to the preallocated feature buffer instead of df.
+        buffer (ndarray): Column-major feature buffer used in compact mode; float dtype, or int8 when td is set.
+        names (list): The feature column names stored in the buffer.
+        lazy (bool): A flag indicating whether indicator calls only register columns that are calculated on access.
+        specs (dict): Lazy column name -> (indicator name, period, td, k_period).
+        cache (dict): Lazy column name -> calculated values, cleared when the OHLCV columns change.
 
     Methods:
         view_data(n=10): Prints the first n rows of the DataFrame.
@@ -19,34 +146,180 @@ class Indicator:
         view_cols(): Returns the column names of the DataFrame.
         set_colnames(col_names): Sets the column names of the DataFrame.
         make_up_down(): Creates a column 'movement' indicating the up or down signals from the 'Close' column.
-        get_df(): Returns the DataFrame.
+        get_df(columns=None): Returns the DataFrame (in compact mode df joined with the feature view, in lazy
+            mode df joined with the requested or all registered columns).
+        features(): Returns the feature buffer as a DataFrame view without copying.
+        register(name, period=None, k_period=14) / add_columns(*columns): Register lazy columns, e.g. add_columns('sma_20', 'rsi_14_td').
+        column(name): Returns one lazy column, calculating it on first access.
+        invalidate(): Drops the memoized lazy columns, needed after editing OHLCV values in place.
         index_reset(): Resets the index of the DataFrame.
         sma(n=5): Calculates the simple moving averages of the 'Close' column and adds a new column to the DataFrame.
         wma(n=5): Calculates the weighted moving averages of the 'Close' column and adds a new column to the DataFrame.
         momentum(n=7): Calculates the momentum column for a given period and adds a new column to the DataFrame.
         stochastic_k(period=14): Calculates the stochastic k% for a given period and adds a new column to the DataFrame.
-        stochastic_d(period=3): Calculates the stochastic d% using the previously calculated k% and adds a new column to the DataFrame.
+        stochastic_d(period=3, k_period=14): Calculates the stochastic d% using the previously calculated k% (or k% over k_period) and adds a new column to the DataFrame.
         rsi(period=14): Calculates the relative strength index (RSI) for a given period and adds a new column to the DataFrame.
         stochatic_r(period=14): Calculates Larry Williams' R% oscillator for a given period and adds a new column to the DataFrame.
         ad(): Calculates the accumulation/distribution oscillator and adds a new column to the DataFrame.
         cci(period=20): Calculates the commodity channel index (CCI) for a given period and adds a new column to the DataFrame.
         '''
 
-    def __init__(self, df, td=False):
+    def __init__(self, df, td=False, compact=False, dtype=np.float32, capacity=16, lazy=False):
+        """
+        :param df: DataFrame with the OHLCV columns
+        :param td: calculate trend deterministic signals instead of the indicator values
+        :param compact: store features in a preallocated buffer instead of adding DataFrame columns
+        :param dtype: float dtype of the compact buffer; td signals are always stored as int8
+        :param capacity: number of feature columns to preallocate, the buffer doubles when it is full
+        :param lazy: indicator calls register columns, which are calculated and memoized on first access
+        """
         self.df = df
         self.td = td
         self.imp_features = None
         self.k = None
         self.inter = pd.DataFrame()
+        self.compact = compact
+        self.names = []
+        self.buffer = None
+        if compact:
+            self.buffer = np.empty((len(df), capacity), dtype=np.int8 if td else dtype, order='F')
+        self.lazy = lazy
+        self.specs = {}
+        self.cache = {}
+        self.pipeline = None
+        self.key = None
+        self.fingerprint = None
+        self.lazy_k = None
+
+    def _store(self, name, values):
+        """
+        writes a feature column to df, or in compact mode into the next slice of the buffer
+        """
+        if not self.compact:
+            self.df[name] = values
+            return
+        values = values.to_numpy() if isinstance(values, pd.Series) else values
+        if name in self.names:
+            self.buffer[:, self.names.index(name)] = values
+            return
+        if len(self.names) == self.buffer.shape[1]:
+            grown = np.empty((self.buffer.shape[0], max(2*self.buffer.shape[1], 1)), dtype=self.buffer.dtype, order='F')
+            grown[:, :len(self.names)] = self.buffer
+            self.buffer = grown
+        self.buffer[:, len(self.names)] = values
+        self.names.append(name)
+
+    def features(self):
+        """
+        returns the stored features as a DataFrame sharing memory with the buffer; df when not in compact mode
+        :return: DataFrame with df's index
+        """
+        if not self.compact:
+            return self.df
+        return pd.DataFrame(self.buffer[:, :len(self.names)], index=self.df.index, columns=self.names, copy=False)
+
+    # ////////////////////////////////// Lazy columns ///////////////////////////////////////
+
+    def register(self, name, period=None, k_period=14, td=None):
+        """
+        registers a lazy column for an indicator method
+        :param td: trend deterministic flag, defaults to self.td
+        :return: the column name
+        """
+        # imported here since feature_pipeline imports this module
+        from feature_pipeline import FeaturePipeline, DEFAULT_PERIODS
+        td = self.td if td is None else td
+        if period is None:
+            period = DEFAULT_PERIODS.get(name)
+        # like the eager methods, d% uses the period of the k% registered just before it
+        if name == 'stochastic_k':
+            self.lazy_k = period
+        elif name == 'stochastic_d' and self.lazy_k is not None:
+            k_period, self.lazy_k = self.lazy_k, None
+        column = FeaturePipeline([{'name': name, 'periods': [period], 'k_period': k_period}], td=td).columns()[0]
+        self.specs[column] = (name, period, td, k_period)
+        return column
+
+    def add_columns(self, *columns):
+        """
+        registers lazy columns by name, e.g. add_columns('k_5', 'd_3', 'rsi_14_td'); the _td suffix overrides
+        self.td and, as with register, a d% column uses the period of the k% column added just before it
+        """
+        from feature_pipeline import parse_column
+        for column in columns:
+            name, period, td = parse_column(column)
+            self.register(name, period, td=td)
+
+    def _ohlcv_key(self):
+        """
+        cheap change check: replacing df or one of its OHLCV columns gives new arrays
+        """
+        return id(self.df), len(self.df), tuple(self.df[column].to_numpy(dtype=float).__array_interface__['data'][0]
+                                                for column in BASE_COLUMNS if column in self.df.columns)
+
+    def _ohlcv_fingerprint(self):
+        digest = hashlib.blake2b(digest_size=16)
+        for column in BASE_COLUMNS:
+            if column in self.df.columns:
+                values = np.ascontiguousarray(self.df[column].to_numpy(dtype=float))
+                digest.update(column.encode())
+                digest.update(values.view(np.uint8))
+        return len(self.df), digest.hexdigest()
+
+    def _refresh(self, full=False):
+        """
+        drops the memoized columns and intermediates when the OHLCV columns changed since they were calculated
+        :param full: also hash the OHLCV values, which catches in place edits of the existing arrays
+        """
+        from feature_pipeline import FeaturePipeline
+        key = self._ohlcv_key()
+        fingerprint = self._ohlcv_fingerprint() if full or key != self.key else self.fingerprint
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.cache = {}
+            self.pipeline = FeaturePipeline([])
+            self.pipeline.seed({column: self.df[column].to_numpy(dtype=float)
+                                for column in BASE_COLUMNS if column in self.df.columns})
+        self.key = key
+
+    def invalidate(self):
+        self.key = None
+        self.fingerprint = None
+        self.cache = {}
+
+    def _column(self, column):
+        if column not in self.cache:
+            if column not in self.specs:
+                self.add_columns(column)
+            # intermediates such as rolling extremes stay memoized in the pipeline for the other columns
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.cache[column] = self.pipeline.feature(*self.specs[column])
+        return self.cache[column]
+
+    def column(self, column):
+        """
+        returns a lazy column, calculating it the first time it is accessed after the OHLCV data last changed.
+        Only replaced data or columns are noticed here; call invalidate() after editing OHLCV values in place
+        :param column: column name such as 'sma_20' or 'rsi_14_td'
+        :return: Series with df's index
+        """
+        self._refresh()
+        return pd.Series(self._column(column), index=self.df.index, name=column)
 
     def view_data(self, n=10):
-        print(self.df.head(n))
+        print(self.get_df().head(n))
 
     def drop_cols(self,colname):
+        if self.compact and colname in self.names:
+            j = self.names.index(colname)
+            # shift the later features left so the used columns stay contiguous
+            self.buffer[:, j:len(self.names) - 1] = self.buffer[:, j + 1:len(self.names)]
+            self.names.pop(j)
+            return
         self.df.drop(colname,axis=1,inplace=True)
 
     def view_cols(self):
-        return self.df.columns
+        return self.get_df().columns
 
     def set_colnames(self, col_names):
         self.df.columns = col_names
@@ -58,7 +331,14 @@ class Indicator:
         """
         self.df['movement'] = np.sign(self.df['Close'].diff().fillna(0))
 
-    def get_df(self):
+    def get_df(self, columns=None):
+        if self.lazy:
+            self._refresh(full=True)
+            columns = list(self.specs) if columns is None else columns
+            values = {column: self._column(column) for column in columns}
+            return pd.concat([self.df, pd.DataFrame(values, index=self.df.index)], axis=1)
+        if self.compact:
+            return pd.concat([self.df, self.features()], axis=1)
         return self.df
 
     def index_reset(self):
@@ -66,6 +346,8 @@ class Indicator:
 
     # ////////////////////////////////// Methods for calculating the indicators ///////////////////////////////////////
 
+    @profiled('Indicator.sma', rows=_indicator_rows)
+    @_registers
     def sma(self, n=5):
         """
         method adds a column to self containing simple moving averages of Close column
@@ -73,27 +355,26 @@ class Indicator:
         :return: None
         """
         if not self.td:
-            self.df[f'sma_{n}'] = self.df['Close'].rolling(window=n, min_periods=1).mean()
+            self._store(f'sma_{n}', self.df['Close'].rolling(window=n, min_periods=1).mean())
         else:
-            self.df[f'sma_{n}_td'] = np.sign(self.df['Close'] - self.df['Close'].rolling(window=n, min_periods=1).mean())
+            self._store(f'sma_{n}_td', np.sign(self.df['Close'] - self.df['Close'].rolling(window=n, min_periods=1).mean()))
 
+    @profiled('Indicator.wma', rows=_indicator_rows)
+    @_registers
     def wma(self, n=5):
-        denom = n*(n+1)/2
-        closes = list(self.df['Close'])
-        means = []
-        for i in range(len(closes)):
-            if n < i < len(closes)-n:
-                mean = closes[i]
-            else:
-                mean = sum(closes[i-n:i])/denom
-            means.append(mean)
+        """
+        Calculates the weighted moving average column for a window n of the Close column
+        :param n: window length
+        :return: None
+        """
+        means = _wma_values(self.df['Close'].to_numpy(dtype=float), n)
         if not self.td:
-            self.df[f'wma_{n}'] = means
+            self._store(f'wma_{n}', means)
         else:
-            means.insert(0, 0)
-            means = np.array(means)
-            self.df[f'wma_{n}_td'] = np.sign(np.diff(means))
+            self._store(f'wma_{n}_td', np.sign(np.diff(means, prepend=0)))
 
+    @profiled('Indicator.momentum', rows=_indicator_rows)
+    @_registers
     def momentum(self, n=7):
         """
         Calculates the momentum column for a period n for the Close column
@@ -101,12 +382,14 @@ class Indicator:
         :return: None
         """
         if not self.td:
-            self.df[f'momentum_{n}'] = self.df['Close'] - self.df['Close'].shift(n).fillna(0)
+            self._store(f'momentum_{n}', self.df['Close'] - self.df['Close'].shift(n).fillna(0))
         else:
-            temp = (self.df['Close'] - self.df['Close'].shift(n).fillna(0))
-            self.df[f'momentum_{n}_td'] = [1 if i > 0 else -1 if i < 0 else 0 for i in temp]
+            temp = (self.df['Close'] - self.df['Close'].shift(n).fillna(0)).to_numpy()
+            self._store(f'momentum_{n}_td', np.select([temp > 0, temp < 0], [1, -1], 0))
             del temp
 
+    @profiled('Indicator.stochastic_k', rows=_indicator_rows)
+    @_registers
     def stochastic_k(self, period=14):
         """
         Calculates stochastic k% for period 14; creates duplicate attribute self.k for d%
@@ -117,24 +400,35 @@ class Indicator:
         Highest_High = self.df['High'].rolling(window=period, min_periods=7).max()
         self.k = 100 * ((self.df['Close'] - Lowest_Low) / (Highest_High - Lowest_Low))
         if not self.td:
-            self.df[f'k_{period}'] = self.k.fillna(0)
+            self._store(f'k_{period}', self.k.fillna(0))
         else:
-            self.df[f'k_{period}_td'] = np.sign(self.k.diff().fillna(0))
+            self._store(f'k_{period}_td', np.sign(self.k.diff().fillna(0)))
         del Highest_High, Lowest_Low
 
-    def stochastic_d(self, period=3):
+    @profiled('Indicator.stochastic_d', rows=_indicator_rows)
+    @_registers
+    def stochastic_d(self, period=3, k_period=14):
         """
-        Calculates stochastic d% using self.k; Always run after k%; deletes self.k
+        Calculates stochastic d% using self.k from the last stochastic_k call, or k% over k_period when
+        stochastic_k has not been run; resets self.k
         :param period: int. period to take MA
+        :param k_period: int. period of k% when self.k is not set
         :return: None
         """
+        k = self.k
+        if k is None:
+            Lowest_Low = self.df['Low'].rolling(window=k_period, min_periods=7).min()
+            Highest_High = self.df['High'].rolling(window=k_period, min_periods=7).max()
+            k = 100 * ((self.df['Close'] - Lowest_Low) / (Highest_High - Lowest_Low))
         if not self.td:
-            self.df[f'd_{period}'] = self.k.rolling(window=period).mean().fillna(0)
+            self._store(f'd_{period}', k.rolling(window=period).mean().fillna(0))
         else:
-            self.df[f'd_{period}_td'] = np.sign(self.k.rolling(window=period).mean().diff().fillna(0))
+            self._store(f'd_{period}_td', np.sign(k.rolling(window=period).mean().diff().fillna(0)))
 
-        del self.k
+        self.k = None
 
+    @profiled('Indicator.rsi', rows=_indicator_rows)
+    @_registers
     def rsi(self, period=14):
         """
         Calculates RSI for period 14; deletes local vars
@@ -144,30 +438,14 @@ class Indicator:
         delta = self.df['Close'].diff()
         rs = delta.where(delta > 0, 0).rolling(window=period, min_periods=1).mean() / (-delta.where(delta < 0, 0)).rolling(window=period, min_periods=1).mean()
         if not self.td:
-            self.df[f'rsi_{period}'] = 100 - (100/(1 + rs))
-            self.df[f'rsi_{period}'] = self.df[f'rsi_{period}'].fillna(0)
+            self._store(f'rsi_{period}', (100 - (100/(1 + rs))).fillna(0))
         else:
             rsi = (100 - (100/(1 + rs)))
-            vals = []
-            for i, value in enumerate(rsi):
-                if value <= 30:
-                    vals.append(1)
-                elif value >= 70:
-                    vals.append(-1)
-                else:
-                    if i > 0:
-                        if value > rsi[i-1]:
-                            vals.append(-1)
-                        elif value < rsi[i-1]:
-                            vals.append(1)
-                        elif value == rsi[i-1]:
-                            vals.append(0)
-                    else:
-                        vals.append(1)
-            self.df[f'rsi_{period}_td'] = vals
-            self.df[f'rsi_{period}_td'] = self.df[f'rsi_{period}_td'].fillna(0)
+            self._store(f'rsi_{period}_td', _oscillator_td(rsi, 30, 70))
         del rs, delta
 
+    @profiled('Indicator.stochatic_r', rows=_indicator_rows)
+    @_registers
     def stochatic_r(self, period=14):
         """
         Calculates Larry Williams' R% oscillator
@@ -177,10 +455,12 @@ class Indicator:
         Lowest_Low = self.df['Low'].rolling(window=period,min_periods=7).min()
         Highest_High = self.df['High'].rolling(window=period,min_periods=7).max()
         if not self.td:
-            self.df[f'r_{period}'] = (100*(Highest_High - self.df['Close'])/(Highest_High-Lowest_Low)).fillna(0)
+            self._store(f'r_{period}', (100*(Highest_High - self.df['Close'])/(Highest_High-Lowest_Low)).fillna(0))
         else:
-            self.df[f'r_{period}_td'] = np.sign(((Highest_High - self.df['Close'])/(Highest_High-Lowest_Low)).diff().fillna(0))
+            self._store(f'r_{period}_td', np.sign(((Highest_High - self.df['Close'])/(Highest_High-Lowest_Low)).diff().fillna(0)))
 
+    @profiled('Indicator.ad', rows=_indicator_rows)
+    @_registers
     def ad(self):
         """
         calculates the accumulation/distribution oscillator
@@ -188,55 +468,21 @@ class Indicator:
         """
         mfv = self.df['Volume'] * (((2*self.df['Close']) - self.df['High'] - self.df['Low']) / ((self.df['High'] - self.df['Low'])))
         if not self.td:
-            self.df['ad'] = mfv.cumsum()
+            self._store('ad', mfv.cumsum())
         else:
-            self.df['ad_td'] = np.sign(mfv.cumsum().diff().fillna(0))
+            self._store('ad_td', np.sign(mfv.cumsum().diff().fillna(0)))
 
+    @profiled('Indicator.cci', rows=_indicator_rows)
+    @_registers
     def cci(self, period=20):
         """
         calculates the commodity channel index
         :return: None
         """
-        temp = np.array([(x+y+z)/3 for x,y,z in zip(self.df['Close'], self.df['High'], self.df['Low'])])
-        tempdf = pd.DataFrame(temp,columns=['tempvar'])
-        sma = tempdf['tempvar'].rolling(window=period, min_periods=1).mean()
-        dev = [abs(x-y) for x,y in zip(temp,sma)]
-        means = []
-        for i in range(len(dev)):
-            if 10 <= i <= len(dev)-10:
-                mean = sum(dev[i-10:i+11])/21
-            else:
-                mean = dev[i]
-            means.append(mean)
-        ccis = [(x-y)/(0.015*z) for x,y,z in zip(temp,sma,means)]
+        ccis = _cci_values(self.df['Close'].to_numpy(dtype=float), self.df['High'].to_numpy(dtype=float),
+                           self.df['Low'].to_numpy(dtype=float), period)
         if not self.td:
-            self.df[f'cci_{period}'] = ccis
+            self._store(f'cci_{period}', ccis)
         else:
-            vals = []
-            for i, values in enumerate(ccis):
-                if values >= 200:
-                    vals.append(-1)
-                elif values <= -200:
-                    vals.append(1)
-                else:
-                    if i > 0:
-                        if values > ccis[i - 1]:
-                            vals.append(-1)
-                        elif values < ccis[i - 1]:
-                            vals.append(1)
-                        else:
-                            vals.append(0)
-                    else:
-                        vals.append(1)
-            self.df[f'cci_{period}_td'] = vals
-            del vals
-        del temp, tempdf, sma, dev, means, ccis
-
-
-
-
-
-
-
-
-
+            self._store(f'cci_{period}_td', _oscillator_td(ccis, -200, 200))
+        del ccis
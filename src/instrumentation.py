@@ -0,0 +1,250 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import pandas as pd
+
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'logs')
+
+# checked on every instrumented call; everything else only runs when profiling is on
+ENABLED = False
+
+_settings = {'memory': False, 'log_dir': LOG_DIR, 'log_path': None}
+_lock = threading.Lock()
+_records = []
+_pending = []
+_local = threading.local()
+
+
+def enable(log_dir: str=None, memory: bool=False):
+    """
+    Turns profiling on
+    :param log_dir: folder for the jsonl logs and reports, defaults to the repo's logs folder
+    :param memory: also trace allocations with tracemalloc (slows the instrumented code down)
+    :return: None
+    """
+    global ENABLED
+    _settings['memory'] = memory
+    _settings['log_dir'] = log_dir or LOG_DIR
+    _settings['log_path'] = None
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    flush()
+    ENABLED = False
+    if _settings['memory'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def _loggable(value):
+    return isinstance(value, (int, float, bool)) or (isinstance(value, str) and len(value) <= 64)
+
+
+def _truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def configure(config_path: str=None):
+    """
+    Enables profiling when the TRADING_PROFILE env var is set, or when the 'profiling' section of the config
+    file has enabled: True. TRADING_PROFILE_MEMORY / memory and TRADING_LOG_DIR / log_dir set the options.
+    :param config_path: optional path to the yaml config file
+    :return: True if profiling is on
+    """
+    section = {}
+    if config_path is not None and os.path.exists(config_path):
+        # imported here since extract_data imports this module
+        from extract_data import load_config
+        section = (load_config(config_path) or {}).get('profiling') or {}
+    enabled = _truthy(os.environ.get('TRADING_PROFILE', section.get('enabled', False)))
+    if enabled:
+        enable(log_dir=os.environ.get('TRADING_LOG_DIR', section.get('log_dir')),
+               memory=_truthy(os.environ.get('TRADING_PROFILE_MEMORY', section.get('memory', False))))
+    return enabled
+
+
+class _NoStage:
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage:
+    '''Times one stage and records it on exit. Memory peaks of nested stages are passed up to the enclosing one.
+
+    tracemalloc counts the whole process and reset_peak() is global, so memory is only recorded for stages on
+    the main thread; stages in worker threads (e.g. the per-symbol fetches) record their wall time only, and the
+    enclosing main thread stage (e.g. fetch_all) holds the peak of all of them.'''
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.memory = None
+
+    def __enter__(self):
+        if _settings['memory'] and threading.current_thread() is threading.main_thread():
+            current, peak = tracemalloc.get_traced_memory()
+            stack = _local.__dict__.setdefault('stack', [])
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            tracemalloc.reset_peak()
+            self.memory = [current, current]
+            stack.append(self.memory)
+        self.start = time.perf_counter()
+        return self.fields
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        record = {'time': time.time(), 'stage': self.name, 'wall': wall, 'thread': threading.current_thread().name}
+        record.update(self.fields)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if self.memory is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            stack = _local.stack
+            start, inner_peak = stack.pop()
+            peak = max(peak, inner_peak)
+            if stack:
+                stack[-1][1] = max(stack[-1][1], peak)
+            record['mem_delta'] = current - start
+            record['mem_peak'] = peak - start
+        _add(record)
+        return False
+
+
+def stage(name: str, **fields):
+    """
+    Context manager timing a block; the dict it returns can be filled with extra fields such as rows or bytes.
+    Returns a shared no-op when profiling is off.
+    :param name: stage name, e.g. 'fetch' or 'Indicator.rsi'
+    :param fields: extra fields for the record
+    """
+    if not ENABLED:
+        return _NO_STAGE
+    return _Stage(name, fields)
+
+
+def profiled(name: str=None, rows=None, result_rows=None):
+    """
+    Decorator recording every call of a function as a stage
+    :param name: stage name, defaults to the function's qualified name
+    :param rows: optional function of the call arguments returning the number of rows processed
+    :param result_rows: optional function of the return value returning the number of rows, used instead of rows
+    """
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            fields = {}
+            if args or kwargs:
+                fields['args'] = [arg for arg in args if _loggable(arg)] + \
+                                 [f'{key}={value}' for key, value in kwargs.items() if _loggable(value)]
+            if rows is not None:
+                try:
+                    fields['rows'] = int(rows(*args, **kwargs))
+                except (TypeError, ValueError, AttributeError):
+                    pass
+            with _Stage(label, fields):
+                result = func(*args, **kwargs)
+                if result_rows is not None:
+                    fields['rows'] = int(result_rows(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def _add(record):
+    with _lock:
+        _records.append(record)
+        _pending.append(record)
+        full = len(_pending) >= 1000
+    if full:
+        flush()
+
+
+def flush():
+    """
+    Appends the records not yet written to the jsonl log in the log folder
+    :return: path of the log file, or None if nothing was written
+    """
+    with _lock:
+        pending = _pending[:]
+        _pending.clear()
+        if not pending:
+            return _settings['log_path']
+        if _settings['log_path'] is None:
+            os.makedirs(_settings['log_dir'], exist_ok=True)
+            name = f"profile_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.jsonl"
+            _settings['log_path'] = os.path.join(_settings['log_dir'], name)
+        with open(_settings['log_path'], 'a') as file:
+            for record in pending:
+                file.write(json.dumps(record, default=str) + '\n')
+    return _settings['log_path']
+
+
+atexit.register(flush)
+
+
+def records():
+    with _lock:
+        return pd.DataFrame(_records)
+
+
+def reset():
+    flush()
+    with _lock:
+        _records.clear()
+
+
+def report(by: list=None):
+    """
+    Aggregates the records of this process
+    :param by: columns to group by, defaults to ['stage']; e.g. ['stage', 'symbol'] for fetch latency per symbol
+    :return: DataFrame with calls, total/mean/max wall time, rows, rows per second and memory (when traced)
+    """
+    df = records()
+    if df.empty:
+        return df
+    by = by or ['stage']
+    df = df.copy()
+    for column in ['rows', 'bytes', 'mem_peak', 'mem_delta']:
+        if column not in df.columns:
+            df[column] = float('nan')
+    grouped = df.groupby(by, dropna=False)
+    summary = grouped.agg(calls=('wall', 'size'), wall_total=('wall', 'sum'), wall_mean=('wall', 'mean'),
+                          wall_max=('wall', 'max'), rows=('rows', 'sum'), bytes=('bytes', 'sum'),
+                          mem_peak_max=('mem_peak', 'max'), mem_delta_total=('mem_delta', 'sum'))
+    summary['rows_per_sec'] = summary['rows'] / summary['wall_total']
+    return summary.sort_values('wall_total', ascending=False)
+
+
+def write_report(path: str=None, by: list=None):
+    """
+    Writes the aggregated report as csv next to the logs
+    :return: path of the report
+    """
+    flush()
+    if path is None:
+        os.makedirs(_settings['log_dir'], exist_ok=True)
+        path = os.path.join(_settings['log_dir'], f"profile_report_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.csv")
+    report(by).to_csv(path)
+    return path
+
+
+configure()
@@ -0,0 +1,214 @@
+import asyncio
+import time
+import numpy as np
+import pandas as pd
+from extract_data import ConnectionPool, RateLimiter, construct_urls, read_json_frame
+from streaming_indicator import StreamingIndicator
+
+
+# seconds per bar of the intraday endpoints in config_file.yml
+CADENCE = {'1min': 60, '5min': 300}
+# request dates are exchange dates, not the local date of the machine
+EXCHANGE_TZ = 'America/New_York'
+
+
+def _parse_spec(spec):
+    if isinstance(spec, str):
+        return spec, ()
+    return spec[0], tuple(spec[1:])
+
+
+class LiveIngestor:
+    '''Polls the intraday endpoints for many symbols and feeds new bars through StreamingIndicator.
+
+    One poller task per symbol wakes up at every bar boundary, fetches the endpoint over the keep-alive
+    ConnectionPool (in a worker thread, together with the json parse) and keeps a cursor with the latest bar
+    it has seen. Requests start at the cursor's day, so templates with from/to fields only transfer that day;
+    bars at or before the cursor and repeated bars are dropped on arrival. New bars go
+    through a bounded queue to a single consumer that updates each symbol's StreamingIndicator; when the
+    consumer falls behind the queue fills up and the pollers wait on put, which is the backpressure.
+
+    Attributes:
+        symbols (list): The symbols to poll.
+        data_freq (str): The request template to use, e.g. '1min' or '5min'.
+        cursors (dict): Symbol -> timestamp of the last bar passed on.
+        indicators (dict): Symbol -> StreamingIndicator.
+        metrics (dict): Symbol -> dict of counters and latencies in seconds.
+
+    Methods:
+        run(duration=None): Polls until stop() is called or duration seconds have passed.
+        stop(): Stops the pollers and the consumer after the queued bars are processed.
+        report(): Returns the metrics as a DataFrame.
+        '''
+
+    def __init__(self, symbols: list, data_freq: str, config_path: str, key_name: str, indicators: list=None,
+                 td: bool=False, queue_size: int=1000, max_concurrency: int=8, rate_limit: float=None,
+                 poll_interval: float=None, delay: float=2.0, timeout: float=30, on_features=None, max_rows: int=0):
+        """
+        :param symbols: list of symbols to poll
+        :param data_freq: request template in the config file, e.g. '1min' or '5min'
+        :param config_path: path to the yaml config file
+        :param key_name: the key in the config file holding the api key
+        :param indicators: StreamingIndicator methods to register for each symbol, either a name or a tuple
+                           (name, *args), e.g. ['sma', ('rsi', 14), ('stochastic_k', 14), ('stochastic_d', 3)]
+        :param td: compute the trend deterministic signals
+        :param queue_size: max bars waiting for the consumer
+        :param max_concurrency: max requests in flight
+        :param rate_limit: max requests started per second for the api key (None for no limit)
+        :param poll_interval: seconds between polls, defaults to the bar length of data_freq
+        :param delay: seconds to wait after a bar boundary so the closed bar is available
+        :param timeout: socket timeout in seconds
+        :param on_features: optional function called with (symbol, features dict) for every new bar
+        :param max_rows: rows of history each StreamingIndicator keeps for get_df; 0 keeps none so memory stays
+                         constant however long the ingestor runs, None keeps everything
+        """
+        self.symbols = list(symbols)
+        self.data_freq = data_freq
+        self.config_path = config_path
+        self.key_name = key_name
+        self.specs = [_parse_spec(spec) for spec in (indicators or [])]
+        self.td = td
+        self.queue_size = queue_size
+        self.max_concurrency = max_concurrency
+        self.poll_interval = poll_interval or CADENCE.get(data_freq, 60)
+        self.delay = delay
+        self.on_features = on_features
+        self.max_rows = max_rows
+        self.pool = ConnectionPool(timeout=timeout)
+        self.limiter = RateLimiter(rate_limit)
+
+        self.cursors = {symbol: None for symbol in self.symbols}
+        self.indicators = {symbol: self._make_indicator() for symbol in self.symbols}
+        self.metrics = {symbol: {'polls': 0, 'errors': 0, 'new_bars': 0, 'duplicates': 0, 'fetch_last': np.nan,
+                                 'fetch_max': 0.0, 'fetch_total': 0.0, 'process_max': 0.0, 'process_total': 0.0}
+                        for symbol in self.symbols}
+        self.stopping = None
+
+    def _make_indicator(self):
+        indicator = StreamingIndicator(td=self.td, max_rows=self.max_rows)
+        for name, args in self.specs:
+            getattr(indicator, name)(*args)
+        return indicator
+
+    def _fetch(self, symbol):
+        """
+        Requests and parses the endpoint for symbol; runs in a worker thread
+        """
+        cursor = self.cursors[symbol]
+        today = pd.Timestamp.now(tz=EXCHANGE_TZ)
+        fromdate = (cursor or today).strftime('%Y-%m-%d')
+        todate = today.strftime('%Y-%m-%d')
+        url = construct_urls(config_path=self.config_path, key_name=self.key_name, data_freq=self.data_freq,
+                             fromdate=fromdate, todate=todate, symbol=symbol)
+        self.limiter.wait(self.key_name)
+        return read_json_frame(self.pool.request(url))[1]
+
+    def _new_bars(self, symbol, df):
+        """
+        Returns the bars newer than the cursor in time order, without repeated timestamps
+        """
+        if not len(df):
+            return df
+        received = len(df)
+        df = df.sort_values('date', kind='stable').drop_duplicates(subset='date', keep='last')
+        cursor = self.cursors[symbol]
+        new = df if cursor is None else df[df['date'] > cursor]
+        # bars repeated within the payload and bars at or before the cursor
+        self.metrics[symbol]['duplicates'] += received - len(new)
+        return new
+
+    async def _sleep_until_next_poll(self):
+        interval = self.poll_interval
+        wait = interval - (time.time() % interval) + self.delay if interval >= 60 else interval
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _poll(self, symbol, queue, semaphore):
+        metrics = self.metrics[symbol]
+        while not self.stopping.is_set():
+            start = time.perf_counter()
+            try:
+                async with semaphore:
+                    df = await asyncio.to_thread(self._fetch, symbol)
+            except Exception as error:
+                metrics['errors'] += 1
+                print('Error polling:', symbol, error)
+            else:
+                received = time.perf_counter()
+                elapsed = received - start
+                metrics['polls'] += 1
+                metrics['fetch_last'] = elapsed
+                metrics['fetch_max'] = max(metrics['fetch_max'], elapsed)
+                metrics['fetch_total'] += elapsed
+                new = self._new_bars(symbol, df)
+                if len(new):
+                    self.cursors[symbol] = new['date'].iloc[-1]
+                    bars = new.rename(columns=str.title).to_dict('records')
+                    for bar in bars:
+                        # waits here while the queue is full
+                        await queue.put((symbol, bar, received))
+            await self._sleep_until_next_poll()
+
+    async def _consume(self, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            symbol, bar, received = item
+            metrics = self.metrics[symbol]
+            try:
+                features = self.indicators[symbol].update(bar)
+                latency = time.perf_counter() - received
+                metrics['new_bars'] += 1
+                metrics['process_max'] = max(metrics['process_max'], latency)
+                metrics['process_total'] += latency
+                if self.on_features is not None:
+                    self.on_features(symbol, features)
+            except Exception as error:
+                # a bad bar or a failing callback must not stop the consumer, the pollers would block on put
+                metrics['errors'] += 1
+                print('Error processing bar for:', symbol, repr(error))
+            finally:
+                queue.task_done()
+
+    async def run(self, duration: float=None):
+        """
+        Polls every symbol until stop() is called or duration seconds have passed
+        :param duration: seconds to run for, None to run until stop()
+        :return: the metrics report
+        """
+        self.stopping = asyncio.Event()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        consumer = asyncio.create_task(self._consume(queue))
+        pollers = [asyncio.create_task(self._poll(symbol, queue, semaphore)) for symbol in self.symbols]
+        try:
+            if duration is None:
+                await self.stopping.wait()
+            else:
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), timeout=duration)
+                except asyncio.TimeoutError:
+                    self.stopping.set()
+            await asyncio.gather(*pollers)
+            await queue.put(None)
+            await consumer
+        finally:
+            for task in pollers + [consumer]:
+                task.cancel()
+            self.pool.close()
+        return self.report()
+
+    def stop(self):
+        if self.stopping is not None:
+            self.stopping.set()
+
+    def report(self):
+        report = pd.DataFrame(self.metrics).T
+        report['fetch_mean'] = report['fetch_total'] / report['polls'].where(report['polls'] > 0)
+        report['process_mean'] = report['process_total'] / report['new_bars'].where(report['new_bars'] > 0)
+        report['cursor'] = pd.Series(self.cursors)
+        return report.drop(columns=['fetch_total', 'process_total'])
@@ -0,0 +1,263 @@
+import json
+import os
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import joblib
+import numpy as np
+import pandas as pd
+
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')
+
+
+def _versions(model_dir):
+    if not os.path.isdir(model_dir):
+        return []
+    return sorted(int(entry[1:]) for entry in os.listdir(model_dir) if entry.startswith('v') and entry[1:].isdigit())
+
+
+def save_model(name: str, estimator=None, feature_columns: list=None, mask=None, scaler=None, pca=None,
+               pca_model: dict=None, metadata: dict=None, models_dir: str=None):
+    """
+    Saves a fitted feature pipeline and estimator as the next version of a model in models/.
+    The pipeline applied at prediction time is: feature_columns -> mask -> scaler -> pca -> estimator, every
+    step optional. The scaler and pca are stored as plain .npy arrays so they can be memory mapped on load.
+    :param name: model name, the folder under models_dir
+    :param estimator: fitted estimator with a predict method (stored with joblib), or None
+    :param feature_columns: the input feature column names in order
+    :param mask: bool array over feature_columns of the selected features, e.g. ranking == 1 from Boruta_py
+    :param scaler: fitted StandardScaler (fitted on the selected features)
+    :param pca: fitted PCA / IncrementalPCA; with whiten=True the whitening is folded into the stored components
+    :param pca_model: dict saved by principalca / principalca_incremental, sets scaler, pca and feature_columns
+    :param metadata: extra json serializable information, e.g. training dates or metrics
+    :param models_dir: folder holding the models, defaults to the repo's models folder
+    :return: path of the saved version
+    """
+    if pca_model is not None:
+        scaler, pca = pca_model['scaler'], pca_model['pca']
+        feature_columns = feature_columns or pca_model['columns']
+    model_dir = os.path.join(models_dir or MODELS_DIR, name)
+    os.makedirs(model_dir, exist_ok=True)
+    version = max(_versions(model_dir), default=0) + 1
+    path = os.path.join(model_dir, f'v{version:04d}')
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    arrays = {}
+    if mask is not None:
+        arrays['mask'] = np.asarray(mask, dtype=bool)
+    if scaler is not None:
+        arrays['scaler_mean'] = np.asarray(scaler.mean_ if scaler.with_mean else np.zeros_like(scaler.scale_), dtype=float)
+        arrays['scaler_scale'] = np.asarray(scaler.scale_ if scaler.with_std else np.ones_like(scaler.mean_), dtype=float)
+    if pca is not None:
+        arrays['pca_mean'] = np.asarray(pca.mean_, dtype=float)
+        components = np.asarray(pca.components_.T, dtype=float)
+        if getattr(pca, 'whiten', False):
+            # whitened models divide every component by its standard deviation
+            components = components / np.sqrt(pca.explained_variance_)
+        arrays['pca_components'] = np.ascontiguousarray(components)
+    for key, values in arrays.items():
+        np.save(os.path.join(tmp, f'{key}.npy'), values)
+    if estimator is not None:
+        joblib.dump(estimator, os.path.join(tmp, 'estimator.joblib'))
+
+    meta = {'name': name, 'version': version, 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'feature_columns': list(feature_columns) if feature_columns is not None else None,
+            'arrays': sorted(arrays), 'estimator': type(estimator).__name__ if estimator is not None else None,
+            'metadata': metadata or {}}
+    with open(os.path.join(tmp, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=2, default=str)
+    os.replace(tmp, path)
+    return path
+
+
+class ModelArtifact:
+    '''A saved model version loaded for batch inference.
+
+    The pipeline arrays are memory mapped and the feature transform is plain numpy, so scoring the latest
+    rows of many symbols is a few matrix operations in one call.
+
+    Attributes:
+        path (str): Folder of the loaded version.
+        meta (dict): The saved meta.json.
+        arrays (dict): Memory mapped pipeline arrays (mask, scaler_mean, scaler_scale, pca_mean, pca_components).
+        estimator: The fitted estimator or None.
+
+    Methods:
+        transform(x, fill_value=None): Applies column selection, mask, scaler and pca.
+        predict(x, fill_value=None): Scores a DataFrame or (rows x features) array, rows with missing features predict NaN.
+        predict_latest(frames, fill_value=None): Scores the last row of every symbol's feature frame.
+        '''
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as file:
+            self.meta = json.load(file)
+        self.arrays = {key: np.load(os.path.join(path, f'{key}.npy'), mmap_mode='r') for key in self.meta['arrays']}
+        estimator_path = os.path.join(path, 'estimator.joblib')
+        self.estimator = joblib.load(estimator_path, mmap_mode='r') if os.path.exists(estimator_path) else None
+
+    def _matrix(self, x, fill_value=None):
+        columns = self.meta['feature_columns']
+        if isinstance(x, pd.DataFrame):
+            x = x[columns] if columns is not None else x
+            x = x.to_numpy(dtype=float, na_value=np.nan)
+        else:
+            x = np.asarray(x, dtype=float)
+        if x.ndim == 1:
+            x = x[None, :]
+        if x.ndim != 2 or (columns is not None and x.shape[1] != len(columns)):
+            raise ValueError(f'Expected rows of {len(columns) if columns is not None else "n"} features, got shape {x.shape}')
+        if fill_value is not None:
+            x = np.where(np.isnan(x), fill_value, x)
+        return x
+
+    def transform(self, x, fill_value=None):
+        """
+        :param x: DataFrame with the feature columns, or (rows x features) array in feature_columns order
+        :param fill_value: value replacing missing features; by default they stay NaN and so do their rows
+        :return: (rows x model inputs) float array
+        """
+        x = self._matrix(x, fill_value)
+        arrays = self.arrays
+        if 'mask' in arrays:
+            x = x[:, arrays['mask']]
+        if 'scaler_mean' in arrays:
+            x = (x - arrays['scaler_mean']) / arrays['scaler_scale']
+        if 'pca_components' in arrays:
+            x = (x - arrays['pca_mean']) @ arrays['pca_components']
+        return x
+
+    def predict(self, x, fill_value=None):
+        """
+        :param fill_value: value replacing missing features; by default rows with a missing selected feature
+                           predict NaN instead of being scored
+        :return: array of predictions, or the transformed features when the model has no estimator
+        """
+        x = self.transform(x, fill_value)
+        if self.estimator is None:
+            return x
+        valid = ~np.isnan(x).any(axis=1)
+        if valid.all():
+            return self.estimator.predict(x)
+        predictions = np.asarray(self.estimator.predict(x[valid])) if valid.any() else np.empty(0)
+        result = np.full((len(x),) + predictions.shape[1:], np.nan,
+                         dtype=float if predictions.dtype.kind in 'biuf' else object)
+        result[valid] = predictions
+        return result
+
+    def predict_latest(self, frames: dict, fill_value=None):
+        """
+        Scores the latest row of every symbol in one vectorized call
+        :param frames: dict of symbol -> feature DataFrame (e.g. from Indicator.get_df)
+        :param fill_value: see predict; by default symbols with a missing latest feature predict NaN
+        :return: Series of predictions indexed by symbol
+        """
+        symbols = list(frames)
+        rows = pd.concat([frames[symbol].iloc[[-1]] for symbol in symbols], ignore_index=True)
+        predictions = self.predict(rows, fill_value)
+        if predictions.ndim > 1:
+            return pd.DataFrame(predictions, index=pd.Index(symbols, name='symbol'))
+        return pd.Series(predictions, index=pd.Index(symbols, name='symbol'), name='prediction')
+
+
+def load_model(name: str, version: int=None, models_dir: str=None):
+    """
+    Loads a saved model version
+    :param name: model name
+    :param version: version number, defaults to the latest
+    :return: ModelArtifact
+    """
+    model_dir = os.path.join(models_dir or MODELS_DIR, name)
+    versions = _versions(model_dir)
+    if not versions:
+        raise FileNotFoundError(f'No saved versions of model {name} in {model_dir}')
+    version = versions[-1] if version is None else version
+    return ModelArtifact(os.path.join(model_dir, f'v{version:04d}'))
+
+
+def list_models(models_dir: str=None):
+    """
+    Returns a DataFrame with the name, version, creation time and estimator of every saved model version
+    """
+    models_dir = models_dir or MODELS_DIR
+    rows = []
+    for name in sorted(os.listdir(models_dir)) if os.path.isdir(models_dir) else []:
+        for version in _versions(os.path.join(models_dir, name)):
+            with open(os.path.join(models_dir, name, f'v{version:04d}', 'meta.json'), 'r') as file:
+                meta = json.load(file)
+            rows.append({key: meta[key] for key in ['name', 'version', 'created', 'estimator']})
+    return pd.DataFrame(rows, columns=['name', 'version', 'created', 'estimator'])
+
+
+def _handler(artifact):
+    class PredictHandler(BaseHTTPRequestHandler):
+        '''POST /predict with {"symbols": [...], "rows": [[...], ...]} (rows in feature_columns order) or
+        {"rows": {"AAPL": {"column": value, ...}, ...}}; GET /meta returns the model's meta.json'''
+
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload, default=float).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/meta':
+                self._reply(200, artifact.meta)
+            else:
+                self._reply(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self._reply(404, {'error': 'not found'})
+                return
+            start = time.perf_counter()
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                rows = request['rows']
+                if isinstance(rows, dict):
+                    symbols = list(rows)
+                    x = pd.DataFrame([rows[symbol] for symbol in symbols])
+                else:
+                    symbols = request.get('symbols') or list(range(len(rows)))
+                    x = np.asarray(rows, dtype=float)
+                predictions = np.asarray(artifact.predict(x))
+                if predictions.dtype.kind == 'f':
+                    # rows with missing features predict NaN, which json has no value for
+                    predictions = np.where(np.isnan(predictions), None, predictions)
+                predictions = predictions.tolist()
+            except (KeyError, ValueError, TypeError, IndexError) as error:
+                self._reply(400, {'error': str(error)})
+                return
+            self._reply(200, {'predictions': dict(zip(map(str, symbols), predictions)),
+                              'latency_ms': (time.perf_counter() - start)*1000})
+
+        def log_message(self, format, *args):
+            pass
+    return PredictHandler
+
+
+def serve(artifact: ModelArtifact, host: str='127.0.0.1', port: int=8765, background: bool=False):
+    """
+    Serves batch predictions over local HTTP
+    :param artifact: ModelArtifact from load_model
+    :param port: port to listen on, 0 picks a free one
+    :param background: run the server in a daemon thread and return it instead of blocking
+    :return: the server when background is set (call shutdown() to stop it)
+    """
+    server = ThreadingHTTPServer((host, port), _handler(artifact))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f'Serving {artifact.meta["name"]} v{artifact.meta["version"]} on http://{host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from indicator import _oscillator_td, _wma_values, _cci_values
+
+
+FIELDS = ['Close', 'High', 'Low', 'Volume']
+
+
+def panel_from_frame(df: pd.DataFrame):
+    """
+    Converts a long frame with a (symbol, date) MultiIndex and OHLCV columns into (symbols x time) arrays.
+    Symbols missing a date get NaN for that bar.
+    :param df: DataFrame indexed by (symbol, date)
+    :return: (symbols, dates, dict of field -> 2d array)
+    """
+    panel = {}
+    for field in FIELDS:
+        if field in df.columns:
+            wide = df[field].unstack(level=0)
+            panel[field] = wide.to_numpy(dtype=float).T
+    return list(wide.columns), wide.index, panel
+
+
+def _parse_spec(spec):
+    if isinstance(spec, str):
+        return spec, ()
+    return spec[0], tuple(spec[1:])
+
+
+def _rolling(values, window, min_periods=None):
+    return pd.DataFrame(values).rolling(window=window, min_periods=min_periods)
+
+
+def _fillna(values):
+    return np.where(np.isnan(values), 0, values)
+
+
+def _diff_sign(values):
+    """
+    np.sign(series.diff().fillna(0)) along the time axis
+    """
+    return np.sign(_fillna(np.diff(values, axis=0, prepend=np.nan)))
+
+
+def compute_panel(panel: dict, indicators: list, td: bool=False, dtype=np.float64):
+    """
+    Calculates a set of indicators for all symbols in one vectorized pass per indicator.
+    The values match running Indicator on each symbol separately.
+    :param panel: dict of field -> (symbols x time) array, fields Close, High, Low, Volume
+    :param indicators: list of indicator specs, either a name or a tuple (name, *args) with the Indicator method
+                       arguments, e.g. [('sma', 5), ('rsi', 14), ('stochastic_k', 14), ('stochastic_d', 3), 'ad']
+    :param td: compute the trend deterministic signals instead of the values
+    :param dtype: dtype of the returned feature matrix
+    :return: (features, columns); features has shape (symbols, time, len(indicators))
+    """
+    # time on the first axis so pandas rolling works per symbol column
+    close = np.asarray(panel['Close'], dtype=float).T
+    high = np.asarray(panel['High'], dtype=float).T if 'High' in panel else None
+    low = np.asarray(panel['Low'], dtype=float).T if 'Low' in panel else None
+    volume = np.asarray(panel['Volume'], dtype=float).T if 'Volume' in panel else None
+
+    n_time, n_symbols = close.shape
+    features = np.empty((n_symbols, n_time, len(indicators)), dtype=dtype)
+    columns = []
+    k = None
+    extremes = {}
+
+    def lowest_highest(period):
+        if period not in extremes:
+            extremes[period] = (_rolling(low, period, 7).min().to_numpy(), _rolling(high, period, 7).max().to_numpy())
+        return extremes[period]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for j, spec in enumerate(indicators):
+            name, args = _parse_spec(spec)
+
+            if name == 'sma':
+                n = args[0] if args else 5
+                sma = _rolling(close, n, 1).mean().to_numpy()
+                values = np.sign(close - sma) if td else sma
+                col = f'sma_{n}'
+            elif name == 'wma':
+                n = args[0] if args else 5
+                means = _wma_values(close, n)
+                values = np.sign(np.diff(means, axis=0, prepend=0)) if td else means
+                col = f'wma_{n}'
+            elif name == 'momentum':
+                n = args[0] if args else 7
+                past = np.zeros_like(close)
+                if n < n_time:
+                    past[n:] = close[:n_time - n]
+                values = close - _fillna(past)
+                values = np.select([values > 0, values < 0], [1, -1], 0) if td else values
+                col = f'momentum_{n}'
+            elif name == 'stochastic_k':
+                period = args[0] if args else 14
+                lowest, highest = lowest_highest(period)
+                k = 100 * ((close - lowest) / (highest - lowest))
+                values = _diff_sign(k) if td else _fillna(k)
+                col = f'k_{period}'
+            elif name == 'stochastic_d':
+                period = args[0] if args else 3
+                if k is None:
+                    lowest, highest = lowest_highest(args[1] if len(args) > 1 else 14)
+                    k = 100 * ((close - lowest) / (highest - lowest))
+                d = _rolling(k, period).mean().to_numpy()
+                values = _diff_sign(d) if td else _fillna(d)
+                col = f'd_{period}'
+                k = None
+            elif name == 'rsi':
+                period = args[0] if args else 14
+                delta = np.diff(close, axis=0, prepend=np.nan)
+                rs = _rolling(np.where(delta > 0, delta, 0), period, 1).mean().to_numpy() / _rolling(-np.where(delta < 0, delta, 0), period, 1).mean().to_numpy()
+                rsi = 100 - (100/(1 + rs))
+                values = _oscillator_td(rsi, 30, 70) if td else _fillna(rsi)
+                col = f'rsi_{period}'
+            elif name == 'stochatic_r':
+                period = args[0] if args else 14
+                lowest, highest = lowest_highest(period)
+                if td:
+                    values = _diff_sign((highest - close)/(highest - lowest))
+                else:
+                    values = _fillna(100*(highest - close)/(highest - lowest))
+                col = f'r_{period}'
+            elif name == 'ad':
+                mfv = volume * (((2*close) - high - low) / (high - low))
+                ad = pd.DataFrame(mfv).cumsum().to_numpy()
+                values = _diff_sign(ad) if td else ad
+                col = 'ad'
+            elif name == 'cci':
+                period = args[0] if args else 20
+                ccis = _cci_values(close, high, low, period)
+                values = _oscillator_td(ccis, -200, 200) if td else ccis
+                col = f'cci_{period}'
+            else:
+                raise ValueError(f'Unknown indicator: {name}')
+
+            features[:, :, j] = values.T
+            columns.append(f'{col}_td' if td else col)
+
+    return features, columns
+
+
+def panel_to_frame(features, columns, symbols, dates):
+    """
+    Returns the feature matrix as a DataFrame indexed by (symbol, date)
+    """
+    index = pd.MultiIndex.from_product([symbols, dates], names=['symbol', 'date'])
+    return pd.DataFrame(features.reshape(-1, len(columns)), index=index, columns=columns)
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from feature_pipeline import FeaturePipeline
+
+
+FIELDS = ['Close', 'High', 'Low', 'Volume']
+
+# shared memory views set up once in each worker by _attach
+_worker = {}
+
+
+def parameter_grid(grid: dict, td: bool=False):
+    """
+    Expands a parameter grid into FeaturePipeline entries, one per (indicator, period)
+    :param grid: dict of indicator name -> iterable of periods (None for indicators without one),
+                 e.g. {'sma': range(5, 201), 'rsi': [7, 14, 21], 'ad': None}
+    :param td: td flag for every entry
+    :return: list of FeaturePipeline entries
+    """
+    entries = []
+    for name, periods in grid.items():
+        if periods is None:
+            entries.append({'name': name, 'td': td})
+        else:
+            entries.extend({'name': name, 'periods': [int(period)], 'td': td} for period in periods)
+    return entries
+
+
+def _attach(input_name, input_shape, output_name, output_shape):
+    input_shm = shared_memory.SharedMemory(name=input_name)
+    output_shm = shared_memory.SharedMemory(name=output_name)
+    _worker['shm'] = (input_shm, output_shm)
+    _worker['input'] = np.ndarray(input_shape, dtype=np.float64, buffer=input_shm.buf)
+    _worker['output'] = np.ndarray(output_shape, dtype=np.float64, buffer=output_shm.buf)
+
+
+def _run_job(start, stop, entries, first_column):
+    """
+    Calculates entries for the rows [start, stop) of one symbol and writes them into the shared output
+    """
+    data = {field: _worker['input'][i, start:stop] for i, field in enumerate(FIELDS)}
+    features = FeaturePipeline(entries).compute(data)
+    for j, values in enumerate(features.values()):
+        _worker['output'][start:stop, first_column + j] = values
+    return len(features)
+
+
+def run_parallel(frames: dict, entries: list, max_workers: int=None, chunk_size: int=None):
+    """
+    Calculates a feature grid for many symbols over a process pool.
+    The OHLCV columns of all symbols are packed into one shared memory block and workers write their features
+    into a shared output block, so neither the inputs nor the results are pickled.
+    :param frames: dict of symbol -> DataFrame with Close, High, Low, Volume columns
+    :param entries: FeaturePipeline entries, e.g. from parameter_grid
+    :param max_workers: number of worker processes (defaults to the cpu count)
+    :param chunk_size: number of entries per job; by default entries are split so there are several jobs per worker
+    :return: DataFrame of features indexed by (symbol, original index)
+    """
+    max_workers = max_workers or os.cpu_count()
+    symbols = list(frames)
+    lengths = [len(frames[symbol]) for symbol in symbols]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+    total = int(offsets[-1])
+
+    # one entry per column so jobs can split the grid anywhere
+    entries = [dict(entry, periods=[period]) if 'periods' in entry else entry
+               for entry in entries for period in entry.get('periods', [None])]
+    columns = FeaturePipeline(entries).columns()
+    if chunk_size is None:
+        jobs_per_symbol = max(1, -(-4*max_workers // max(len(symbols), 1)))
+        chunk_size = max(1, -(-len(entries) // jobs_per_symbol))
+
+    input_shape = (len(FIELDS), total)
+    output_shape = (total, len(columns))
+    input_shm = shared_memory.SharedMemory(create=True, size=max(8*len(FIELDS)*total, 1))
+    output_shm = shared_memory.SharedMemory(create=True, size=max(8*total*len(columns), 1))
+    try:
+        packed = np.ndarray(input_shape, dtype=np.float64, buffer=input_shm.buf)
+        for symbol, start, stop in zip(symbols, offsets[:-1], offsets[1:]):
+            for i, field in enumerate(FIELDS):
+                packed[i, start:stop] = frames[symbol][field].to_numpy(dtype=float)
+        del packed
+
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach,
+                                 initargs=(input_shm.name, input_shape, output_shm.name, output_shape)) as executor:
+            futures = [executor.submit(_run_job, int(start), int(stop), entries[first:first + chunk_size], first)
+                       for start, stop in zip(offsets[:-1], offsets[1:])
+                       for first in range(0, len(entries), chunk_size)]
+            for future in futures:
+                future.result()
+
+        features = np.ndarray(output_shape, dtype=np.float64, buffer=output_shm.buf).copy()
+    finally:
+        input_shm.close()
+        input_shm.unlink()
+        output_shm.close()
+        output_shm.unlink()
+
+    index = pd.MultiIndex.from_arrays([np.repeat(symbols, lengths), np.concatenate([frames[symbol].index for symbol in symbols])],
+                                      names=['symbol', 'index'])
+    return pd.DataFrame(features, index=index, columns=columns)
@@ -0,0 +1,190 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from indicator import Indicator, ohlcv_columns
+
+
+PLOTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plots')
+
+# columns drawn over the price, every other column goes in the panel below it
+PRICE_SCALE = ('Close', 'Open', 'High', 'Low', 'sma_', 'wma_')
+
+
+def minmax_indices(y, n_buckets: int):
+    """
+    Min/max bucketing: splits y into n_buckets equal runs and keeps the positions of the lowest and highest
+    value of each run in time order, plus the first and last point. Drawn as a line this covers exactly the
+    same pixels as the full series when n_buckets is the pixel width.
+    :param y: 1d array, NaNs are allowed
+    :param n_buckets: number of buckets, usually the plot width in pixels
+    :return: sorted int array of at most 2*n_buckets + 2 positions
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= 2*n_buckets + 2:
+        return np.arange(n)
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    padded = np.full(n_buckets*size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(n_buckets, size)
+    missing = np.isnan(padded)
+    # all-NaN buckets keep their first position so gaps stay gaps
+    low = np.argmin(np.where(missing, np.inf, padded), axis=1)
+    high = np.argmax(np.where(missing, -np.inf, padded), axis=1)
+    offsets = np.arange(n_buckets)*size
+    keep = np.concatenate([[0, n - 1], offsets + low, offsets + high])
+    return np.unique(keep[keep < n])
+
+
+def lttb_indices(y, n_out: int, x=None):
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last point and from every bucket in between the point
+    forming the largest triangle with the point kept before it and the mean of the next bucket
+    :param y: 1d array; NaN points are only kept when a whole bucket is NaN
+    :param n_out: number of points to keep
+    :param x: optional x values as floats, defaults to the positions
+    :return: sorted int array of n_out positions
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # the mean of every bucket is needed as the third point of the bucket before it
+    filled = np.where(np.isnan(y), 0, y)
+    counts = np.maximum(np.add.reduceat(~np.isnan(y[1:n - 1]), edges[:-1] - 1), 1)
+    mean_y = np.add.reduceat(filled[1:n - 1], edges[:-1] - 1) / counts
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / np.diff(edges)
+    mean_y = np.append(mean_y, y[-1] if not np.isnan(y[-1]) else 0)
+    mean_x = np.append(mean_x, x[-1])
+
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        ax, ay = x[previous], filled[previous]
+        area = np.abs((ax - mean_x[bucket + 1])*(y[start:stop] - ay) - (ax - x[start:stop])*(mean_y[bucket + 1] - ay))
+        area = np.where(np.isnan(area), -1, area)
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def decimate(y, width: int, method: str='minmax', x=None):
+    """
+    :param y: 1d array
+    :param width: target width in pixels
+    :param method: 'minmax' (2 points per pixel, exact envelope) or 'lttb' (one point per pixel, smoother)
+    :return: positions of the points to draw
+    """
+    if method == 'lttb':
+        return lttb_indices(y, width, x)
+    return minmax_indices(y, width)
+
+
+def _times(df):
+    lookup = {str(col).lower(): col for col in df.columns}
+    if 'date' in lookup:
+        return pd.to_datetime(df[lookup['date']]).to_numpy(dtype='datetime64[ns]')
+    if isinstance(df.index, pd.DatetimeIndex):
+        return df.index.to_numpy(dtype='datetime64[ns]')
+    return np.arange(len(df))
+
+
+def chart_series(df: pd.DataFrame, columns: list=(), width: int=1600, method: str='minmax'):
+    """
+    Collects the Close price and indicator columns of one symbol and decimates each to the plot width.
+    Columns missing from df are calculated with a lazy Indicator, e.g. 'sma_20' or 'rsi_14'.
+    :param df: DataFrame with OHLCV columns (FMP or Indicator capitalization) and a date column or DatetimeIndex
+    :param columns: indicator columns to draw
+    :param width: plot width in pixels
+    :param method: decimation method, see decimate
+    :return: dict of column -> (x, y) arrays, small enough to send to a worker process
+    """
+    df = ohlcv_columns(df)
+    # FMP returns newest first; indicators must be calculated in time order
+    times = _times(df)
+    order = np.argsort(times, kind='stable')
+    df, times = df.iloc[order].reset_index(drop=True), times[order]
+
+    indicator = None
+    series = {}
+    for column in ['Close'] + [col for col in columns if col != 'Close']:
+        if column in df.columns:
+            values = df[column].to_numpy(dtype=float)
+        else:
+            if indicator is None:
+                indicator = Indicator(df, lazy=True)
+            values = indicator.column(column).to_numpy(dtype=float)
+        keep = decimate(values, width, method, times.astype(np.int64) if method == 'lttb' else None)
+        series[column] = (times[keep], values[keep])
+    return series
+
+
+def render_chart(symbol: str, series: dict, path: str, width: int=1600, height: int=900, dpi: int=100):
+    """
+    Draws decimated series with the Agg backend and writes the image (format from the file extension)
+    :param series: dict of column -> (x, y) as returned by chart_series
+    :return: path
+    """
+    # the object oriented API with an Agg canvas never touches pyplot or an interactive backend
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    price = [col for col in series if col.startswith(PRICE_SCALE) and not col.endswith('_td')]
+    others = [col for col in series if col not in price]
+
+    figure = Figure(figsize=(width/dpi, height/dpi), dpi=dpi)
+    FigureCanvasAgg(figure)
+    if others:
+        top, bottom = figure.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios': [3, 1]})
+    else:
+        top, bottom = figure.subplots(1, 1), None
+    for column in price:
+        x, y = series[column]
+        top.plot(x, y, linewidth=0.8 if column == 'Close' else 0.6, label=column)
+    for column in others:
+        x, y = series[column]
+        bottom.plot(x, y, linewidth=0.6, label=column)
+    top.set_title(symbol)
+    top.legend(loc='upper left', fontsize='small')
+    if bottom is not None:
+        bottom.legend(loc='upper left', fontsize='small')
+    figure.tight_layout()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    figure.savefig(path)
+    return path
+
+
+def render_charts(frames: dict, columns: list=(), plots_dir: str=None, width: int=1600, height: int=900,
+                  dpi: int=100, method: str='minmax', fmt: str='png', max_workers: int=None):
+    """
+    Renders one chart per symbol into plots_dir. The series are decimated in this process, so workers only
+    receive a few thousand points per line, and the drawing runs in a process pool.
+    :param frames: dict of symbol -> price DataFrame (e.g. from fetch_with_cache or Indicator.get_df)
+    :param columns: indicator columns to overlay, e.g. ['sma_20', 'rsi_14']
+    :param plots_dir: output folder, defaults to the repo's plots folder
+    :param width: image width in pixels, also the number of decimation buckets
+    :param method: 'minmax' or 'lttb'
+    :param fmt: image format, e.g. 'png' or 'svg'
+    :param max_workers: worker processes, defaults to the cpu count; 1 renders in this process
+    :return: dict of symbol -> image path
+    """
+    plots_dir = plots_dir or PLOTS_DIR
+    max_workers = max_workers or os.cpu_count()
+    jobs = []
+    for symbol, df in frames.items():
+        if df is None or not len(df):
+            print('No data to plot for:', symbol)
+            continue
+        path = os.path.join(plots_dir, f'{symbol}.{fmt}')
+        jobs.append((str(symbol), chart_series(df, columns, width, method), path, width, height, dpi))
+
+    if max_workers == 1 or len(jobs) < 2:
+        return {job[0]: render_chart(*job) for job in jobs}
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        futures = {job[0]: executor.submit(render_chart, *job) for job in jobs}
+        return {symbol: future.result() for symbol, future in futures.items()}
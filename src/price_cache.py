@@ -0,0 +1,127 @@
+import os
+import pandas as pd
+from extract_data import construct_urls, get_jsonparsed_data_batch, read_json_frame, template_fields
+
+
+def cache_path(cache_dir: str, symbol: str, data_freq: str):
+    """
+    Returns the path of the parquet file holding the cached history for (symbol, data_freq)
+    """
+    return os.path.join(cache_dir, f'{symbol}_{data_freq}.parquet')
+
+
+def load_cached(cache_dir: str, symbol: str, data_freq: str):
+    """
+    Loads the cached price history for (symbol, data_freq)
+    :return: DataFrame sorted by date, or None if nothing is cached
+    """
+    path = cache_path(cache_dir, symbol, data_freq)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+def save_cached(cache_dir: str, symbol: str, data_freq: str, df: pd.DataFrame):
+    """
+    Writes the price history for (symbol, data_freq); the file is replaced atomically
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(cache_dir, symbol, data_freq)
+    df.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+
+
+def merge_frames(frames: list):
+    """
+    Merges price history frames, keeping the latest row for each date
+    :param frames: list of DataFrames with a 'date' column (None entries are skipped)
+    :return: DataFrame sorted by date
+    """
+    frames = [frame for frame in frames if frame is not None and len(frame)]
+    if not frames:
+        return None
+    merged = pd.concat(frames, ignore_index=True)
+    merged['date'] = pd.to_datetime(merged['date'])
+    merged = merged.drop_duplicates(subset='date', keep='last').sort_values('date')
+    return merged.reset_index(drop=True)
+
+
+def missing_ranges(cached: pd.DataFrame, fromdate: str, todate: str):
+    """
+    Finds the date ranges in [fromdate, todate] that are not covered by the cached frame.
+    The last cached day is requested again since its bars may have been incomplete when fetched.
+    :return: list of (fromdate, todate) string tuples
+    """
+    if cached is None or not len(cached):
+        return [(fromdate, todate)]
+
+    first = cached['date'].iloc[0].normalize()
+    last = cached['date'].iloc[-1].normalize()
+    ranges = []
+    if pd.Timestamp(fromdate) < first:
+        ranges.append((fromdate, (first - pd.Timedelta(days=1)).strftime('%Y-%m-%d')))
+    if pd.Timestamp(todate) >= last:
+        ranges.append((last.strftime('%Y-%m-%d'), todate))
+    return ranges
+
+
+def check_dates(fromdate, todate):
+    """
+    Raises ValueError unless fromdate and todate are dates with fromdate <= todate
+    :return: (fromdate, todate) as Timestamps
+    """
+    if fromdate is None or todate is None:
+        raise ValueError(f'Both dates are needed, got from={fromdate} to={todate}')
+    start, end = pd.Timestamp(fromdate), pd.Timestamp(todate)
+    if pd.isna(start) or pd.isna(end) or start > end:
+        raise ValueError(f'Invalid date range from={fromdate} to={todate}')
+    return start, end
+
+
+def fetch_with_cache(requests: list, config_path: str, key_name: str, cache_dir: str, **fetch_kwargs):
+    """
+    Returns the price history for many symbols, only requesting the date ranges missing from the cache.
+    All missing ranges are fetched in one batch, merged with the cached frames and written back.
+    :param requests: list of (symbol, data_freq, fromdate, todate) tuples
+    :param config_path: path to the yaml config file
+    :param key_name: the key in the config file holding the api key
+    :param cache_dir: folder holding the parquet files
+    :param fetch_kwargs: passed on to get_jsonparsed_data_batch
+    :return: list of DataFrames sliced to [fromdate, todate], in the same order as requests (None where nothing could be fetched)
+    :raises ValueError: when a request has a missing or invalid date range
+    """
+    for _, _, fromdate, todate in requests:
+        check_dates(fromdate, todate)
+
+    cached_frames = []
+    urls = []
+    owners = []
+    for i, (symbol, data_freq, fromdate, todate) in enumerate(requests):
+        cached = load_cached(cache_dir, symbol, data_freq)
+        cached_frames.append(cached)
+        ranges = missing_ranges(cached, fromdate, todate)
+        if not {'from_date', 'to_date'} <= template_fields(config_path, data_freq):
+            # the template cannot ask for a date range: one full download when anything is missing, no top-ups
+            ranges = ranges[:1]
+        for start, end in ranges:
+            urls.append(construct_urls(config_path=config_path, key_name=key_name, data_freq=data_freq,
+                                       fromdate=start, todate=end, symbol=symbol))
+            owners.append(i)
+
+    fetched = [[] for _ in requests]
+    for i, output in zip(owners, get_jsonparsed_data_batch(urls, parser=read_json_frame, **fetch_kwargs)):
+        if output is not None:
+            fetched[i].append(output[1])
+
+    results = []
+    for (symbol, data_freq, fromdate, todate), cached, new in zip(requests, cached_frames, fetched):
+        merged = merge_frames([cached] + new)
+        if merged is None:
+            results.append(None)
+            continue
+        if new:
+            save_cached(cache_dir, symbol, data_freq, merged)
+        end = pd.Timestamp(todate) + pd.Timedelta(days=1)
+        in_range = (merged['date'] >= pd.Timestamp(fromdate)) & (merged['date'] < end)
+        results.append(merged[in_range].reset_index(drop=True))
+    return results
@@ -1,4 +1,5 @@
 import pandas as pd
+import system_check
 
 
 def read_portfolio(path: str):
@@ -11,7 +12,7 @@ def read_portfolio(path: str):
     
 
 if __name__ == '__main__':
-    test_path = 'C:\\Users\\viren\\DSML projects\\trading_alg\\portfolio.csv'
+    test_path = system_check.portfolio_path()
 
     portfolio_df = pd.read_csv(test_path)
     print(portfolio_df)
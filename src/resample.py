@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+
+# request template names in config_file.yml -> bar length
+FREQ_ALIASES = {'1min': '1min', '5min': '5min', 'eod': '1D', 'forex_light': '1D'}
+DAY = np.timedelta64(1, 'D').astype('timedelta64[ns]').astype(np.int64)
+
+
+def _price_columns(df):
+    """
+    Maps open/high/low/close/volume to the frame's column names, which may be FMP (lower case) or Indicator style
+    """
+    lookup = {str(col).lower(): col for col in df.columns}
+    return {field: lookup[field] for field in ['date', 'open', 'high', 'low', 'close', 'volume'] if field in lookup}
+
+
+def _bucket_keys(times, freq_ns, session_start_ns):
+    """
+    Start time (as int64 ns) of the bar each timestamp falls in. Bars never cross a day boundary and intraday
+    bars are aligned to the session open, so hourly bars of a 09:30 session run 09:30-10:30, 10:30-11:30, ...
+    """
+    days = times - times % DAY
+    if freq_ns >= DAY:
+        return days
+    offset = times - days - session_start_ns
+    return days + session_start_ns + (offset // freq_ns)*freq_ns
+
+
+def _to_ns(value):
+    return pd.Timedelta(value).value
+
+
+def resample_bars(df: pd.DataFrame, freq: str, session_start: str=None, session_end: str=None):
+    """
+    Aggregates bars into coarser bars: first open, highest high, lowest low, last close and summed volume.
+    The rows must be sorted by date; each bar is reduced with one ufunc.reduceat call per column.
+    :param df: DataFrame with a date column and open/high/low/close/volume (FMP or Indicator capitalization)
+    :param freq: target bar length, e.g. '5min', '15min', '1h', '1D' or a config name such as 'eod'
+    :param session_start: session open as 'HH:MM', bars before it are dropped and intraday bars align to it
+    :param session_end: session close as 'HH:MM', bars at or after it are dropped
+    :return: DataFrame with the same columns, one row per bar labelled with the bar's start time
+    """
+    columns = _price_columns(df)
+    freq_ns = _to_ns(FREQ_ALIASES.get(freq, freq))
+    times = pd.to_datetime(df[columns['date']]).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    keep = np.ones(len(times), dtype=bool)
+    session_start_ns = 0
+    if session_start is not None:
+        session_start_ns = _to_ns(session_start + ':00')
+        keep &= times % DAY >= session_start_ns
+    if session_end is not None:
+        keep &= times % DAY < _to_ns(session_end + ':00')
+    if not keep.all():
+        df, times = df[keep], times[keep]
+    if not len(times):
+        return df.iloc[:0].copy()
+
+    keys = _bucket_keys(times, freq_ns, session_start_ns)
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(keys)) + 1])
+    ends = np.concatenate([starts[1:], [len(keys)]]) - 1
+
+    out = {columns['date']: pd.to_datetime(keys[starts])}
+    for field, reduce in [('open', None), ('high', np.maximum), ('low', np.minimum), ('close', None), ('volume', np.add)]:
+        if field not in columns:
+            continue
+        values = df[columns[field]].to_numpy(dtype=float)
+        if field == 'open':
+            out[columns[field]] = values[starts]
+        elif field == 'close':
+            out[columns[field]] = values[ends]
+        else:
+            out[columns[field]] = reduce.reduceat(values, starts)
+    return pd.DataFrame(out)[[col for col in df.columns if col in out]]
+
+
+class BarResampler:
+    '''Keeps coarser bar series up to date from a stream of 1-min bars.
+
+    update() takes the new 1-min bars, resamples them with resample_bars and merges the first new bar of every
+    frequency into the open (last) bar when both fall in the same bucket, so a partially filled bar keeps
+    growing until its bucket closes. Closed bars are kept as a list of chunks and only concatenated in get(),
+    so an update costs time proportional to the new bars. One 1-min history therefore feeds every frequency.
+
+    Attributes:
+        freqs (list): The target bar lengths.
+        session_start (str): Session open as 'HH:MM' or None.
+        session_end (str): Session close as 'HH:MM' or None.
+        closed (dict): Frequency -> list of DataFrames of closed bars.
+        open_bars (dict): Frequency -> one row DataFrame with the last bar, which may still be filling up.
+
+    Methods:
+        update(df): Adds new 1-min bars and returns the bars that changed for each frequency.
+        get(freq): Returns all bars of one frequency.
+        '''
+
+    def __init__(self, freqs: list=('5min', '15min', '1h', '1D'), session_start: str=None, session_end: str=None):
+        self.freqs = list(freqs)
+        self.session_start = session_start
+        self.session_end = session_end
+        self.closed = {freq: [] for freq in self.freqs}
+        self.open_bars = {freq: None for freq in self.freqs}
+        self.last_time = None
+
+    @staticmethod
+    def _merge(last, first, columns):
+        """
+        Combines the open bar with the first new bar of the same bucket
+        """
+        merged = last.copy()
+        if 'high' in columns:
+            merged[columns['high']] = max(last[columns['high']], first[columns['high']])
+        if 'low' in columns:
+            merged[columns['low']] = min(last[columns['low']], first[columns['low']])
+        if 'close' in columns:
+            merged[columns['close']] = first[columns['close']]
+        if 'volume' in columns:
+            merged[columns['volume']] = last[columns['volume']] + first[columns['volume']]
+        return merged
+
+    def update(self, df: pd.DataFrame):
+        """
+        Adds 1-min bars newer than the ones already seen
+        :param df: DataFrame of 1-min bars sorted by date
+        :return: dict of freq -> DataFrame with the (possibly updated) open bar and any bars before it that
+                 changed, or None when there was nothing new
+        """
+        columns = _price_columns(df)
+        date = columns['date']
+        dates = pd.to_datetime(df[date])
+        if self.last_time is not None:
+            df, dates = df[(dates > self.last_time).to_numpy()], dates[dates > self.last_time]
+        if not len(df):
+            return {freq: None for freq in self.freqs}
+        self.last_time = dates.iloc[-1]
+
+        changed = {}
+        for freq in self.freqs:
+            new = resample_bars(df, freq, self.session_start, self.session_end)
+            if not len(new):
+                changed[freq] = None
+                continue
+            open_bar = self.open_bars[freq]
+            if open_bar is not None:
+                if new[date].iloc[0] == open_bar[date].iloc[0]:
+                    first = self._merge(open_bar.iloc[0], new.iloc[0], columns)
+                    new = pd.concat([first.to_frame().T.astype(new.dtypes), new.iloc[1:]], ignore_index=True)
+                else:
+                    self.closed[freq].append(open_bar)
+            if len(new) > 1:
+                self.closed[freq].append(new.iloc[:-1])
+            self.open_bars[freq] = new.iloc[-1:].reset_index(drop=True)
+            changed[freq] = new
+        return changed
+
+    def get(self, freq: str):
+        chunks = self.closed[freq]
+        if len(chunks) > 1:
+            # collapse the chunks so later calls do not concatenate them again
+            chunks[:] = [pd.concat(chunks, ignore_index=True)]
+        frames = chunks + ([self.open_bars[freq]] if self.open_bars[freq] is not None else [])
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,289 @@
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+def _sign(value):
+    if value > 0:
+        return 1.0
+    if value < 0:
+        return -1.0
+    if value == 0:
+        return 0.0
+    return np.nan
+
+
+def _divide(x, y):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(x) / np.float64(y))
+
+
+def _diff_sign(value, prev):
+    """
+    np.sign(series.diff().fillna(0)) for one row
+    """
+    delta = value - prev
+    return 0.0 if math.isnan(delta) else _sign(delta)
+
+
+def _oscillator_td_step(value, prev, first, lower, upper):
+    """
+    one row of indicator._oscillator_td
+    """
+    if value <= lower:
+        return 1
+    if value >= upper:
+        return -1
+    if first:
+        return 1
+    if value > prev:
+        return -1
+    if value < prev:
+        return 1
+    return 0
+
+
+class RollingMean:
+    '''Running mean over the last `window` values; follows pandas' rolling mean (compensated sum, NaNs skipped)
+    so the results match Series.rolling(window, min_periods).mean()'''
+
+    def __init__(self, window, min_periods=None):
+        self.window = window
+        self.min_periods = window if min_periods is None else min_periods
+        self.values = deque()
+        self.nobs = 0
+        self.total = 0.0
+        self.compensation = {1: 0.0, -1: 0.0}
+        self.neg_ct = 0
+        self.same_ct = 0
+        self.prev_value = np.nan
+
+    def _add(self, value, sign):
+        # pandas keeps separate compensation terms for added and removed values
+        y = sign*value - self.compensation[sign]
+        t = self.total + y
+        self.compensation[sign] = t - self.total - y
+        self.total = t
+
+    def update(self, value):
+        if len(self.values) == self.window:
+            old = self.values.popleft()
+            if old == old:
+                self.nobs -= 1
+                self._add(old, -1)
+                if math.copysign(1, old) < 0:
+                    self.neg_ct -= 1
+        self.values.append(value)
+        if value == value:
+            self.nobs += 1
+            self._add(value, 1)
+            if math.copysign(1, value) < 0:
+                self.neg_ct += 1
+            self.same_ct = self.same_ct + 1 if value == self.prev_value else 1
+            self.prev_value = value
+
+        if self.nobs < self.min_periods or self.nobs == 0:
+            return np.nan
+        result = self.total / self.nobs
+        if self.same_ct >= self.nobs:
+            result = self.prev_value
+        elif self.neg_ct == 0 and result < 0:
+            result = 0.0
+        elif self.neg_ct == self.nobs and result > 0:
+            result = 0.0
+        return result
+
+
+class RollingExtreme:
+    '''Running min or max over the last `window` values using a monotonic deque'''
+
+    def __init__(self, window, min_periods, func=min):
+        self.window = window
+        self.min_periods = min_periods
+        # a candidate stays in the deque while it beats the new value
+        self.keep = (lambda old, new: old < new) if func is min else (lambda old, new: old > new)
+        self.candidates = deque()
+        self.count = 0
+
+    def update(self, value):
+        while self.candidates and not self.keep(self.candidates[-1][1], value):
+            self.candidates.pop()
+        self.candidates.append((self.count, value))
+        self.count += 1
+        if self.candidates[0][0] <= self.count - 1 - self.window:
+            self.candidates.popleft()
+        if min(self.count, self.window) < self.min_periods:
+            return np.nan
+        return self.candidates[0][1]
+
+
+class StreamingIndicator:
+    '''Incremental version of Indicator for live bars: each registered indicator keeps O(window) state and
+    update(bar) adds one row of features in constant time. The columns match a batch Indicator run on the same bars.
+
+    wma and cci are not available, their values depend on rows after the current one.
+
+    Attributes:
+        td (bool): A flag indicating whether the indicators are trend deterministic or not.
+        steps (list): The update functions of the registered indicators.
+        rows (deque): The last max_rows bars and features (all of them when max_rows is None).
+
+    Methods:
+        sma(n=5), momentum(n=7), stochastic_k(period=14), stochastic_d(period=3), rsi(period=14),
+        stochatic_r(period=14), ad(): register an indicator, same parameters as Indicator.
+        update(bar): Adds one bar and returns its features.
+        warm_up(df): Feeds the rows of a DataFrame through update.
+        get_df(): Returns the kept bars and features as a DataFrame.
+        '''
+
+    def __init__(self, td=False, max_rows=None):
+        """
+        :param td: calculate trend deterministic signals instead of the indicator values
+        :param max_rows: number of rows kept for get_df, None keeps every row and 0 none; the indicator state
+                         does not depend on it, so long running feeds should bound it
+        """
+        self.td = td
+        self.steps = []
+        self.rows = deque(maxlen=max_rows)
+        self.k = None
+
+    def _name(self, name):
+        return f'{name}_td' if self.td else name
+
+    def sma(self, n=5):
+        mean = RollingMean(n, min_periods=1)
+        col = self._name(f'sma_{n}')
+
+        def step(bar, out):
+            value = mean.update(bar['Close'])
+            out[col] = _sign(bar['Close'] - value) if self.td else value
+        self.steps.append(step)
+
+    def momentum(self, n=7):
+        closes = deque(maxlen=n)
+        col = self._name(f'momentum_{n}')
+
+        def step(bar, out):
+            past = closes[0] if len(closes) == n else 0
+            closes.append(bar['Close'])
+            value = bar['Close'] - (0 if past != past else past)
+            if self.td:
+                value = 1 if value > 0 else -1 if value < 0 else 0
+            out[col] = value
+        self.steps.append(step)
+
+    def stochastic_k(self, period=14):
+        lowest = RollingExtreme(period, 7, min)
+        highest = RollingExtreme(period, 7, max)
+        state = {'k': np.nan}
+        self.k = state
+        col = self._name(f'k_{period}')
+
+        def step(bar, out):
+            low, high = lowest.update(bar['Low']), highest.update(bar['High'])
+            prev = state['k']
+            state['k'] = 100 * _divide(bar['Close'] - low, high - low)
+            if self.td:
+                out[col] = _diff_sign(state['k'], prev)
+            else:
+                out[col] = 0.0 if math.isnan(state['k']) else state['k']
+        self.steps.append(step)
+
+    def stochastic_d(self, period=3):
+        """
+        Registers stochastic d% on the most recently registered stochastic_k; register after k%
+        """
+        if self.k is None:
+            raise ValueError('stochastic_d needs stochastic_k to be registered first')
+        k_state = self.k
+        mean = RollingMean(period)
+        state = {'d': np.nan}
+        col = self._name(f'd_{period}')
+
+        def step(bar, out):
+            prev = state['d']
+            state['d'] = mean.update(k_state['k'])
+            if self.td:
+                out[col] = _diff_sign(state['d'], prev)
+            else:
+                out[col] = 0.0 if math.isnan(state['d']) else state['d']
+        self.steps.append(step)
+        self.k = None
+
+    def rsi(self, period=14):
+        gains = RollingMean(period, min_periods=1)
+        losses = RollingMean(period, min_periods=1)
+        state = {'close': np.nan, 'rsi': np.nan, 'first': True}
+        col = self._name(f'rsi_{period}')
+
+        def step(bar, out):
+            delta = bar['Close'] - state['close']
+            state['close'] = bar['Close']
+            gain = gains.update(delta if delta > 0 else 0.0)
+            loss = losses.update(-(delta if delta < 0 else 0.0))
+            rsi = 100 - _divide(100, 1 + _divide(gain, loss))
+            if self.td:
+                out[col] = _oscillator_td_step(rsi, state['rsi'], state['first'], 30, 70)
+            else:
+                out[col] = 0.0 if math.isnan(rsi) else rsi
+            state['rsi'], state['first'] = rsi, False
+        self.steps.append(step)
+
+    def stochatic_r(self, period=14):
+        lowest = RollingExtreme(period, 7, min)
+        highest = RollingExtreme(period, 7, max)
+        state = {'r': np.nan}
+        col = self._name(f'r_{period}')
+
+        def step(bar, out):
+            low, high = lowest.update(bar['Low']), highest.update(bar['High'])
+            if self.td:
+                prev = state['r']
+                state['r'] = _divide(high - bar['Close'], high - low)
+                out[col] = _diff_sign(state['r'], prev)
+            else:
+                r = _divide(100*(high - bar['Close']), high - low)
+                out[col] = 0.0 if math.isnan(r) else r
+        self.steps.append(step)
+
+    def ad(self):
+        state = {'total': 0.0, 'ad': np.nan}
+        col = self._name('ad')
+
+        def step(bar, out):
+            mfv = bar['Volume'] * _divide(2*bar['Close'] - bar['High'] - bar['Low'], bar['High'] - bar['Low'])
+            value = np.nan
+            if not math.isnan(mfv):
+                state['total'] += mfv
+                value = state['total']
+            if self.td:
+                out[col] = _diff_sign(value, state['ad'])
+            else:
+                out[col] = value
+            state['ad'] = value
+        self.steps.append(step)
+
+    def update(self, bar):
+        """
+        Adds one bar and calculates its features
+        :param bar: dict-like with Close, High, Low and Volume
+        :return: dict of the bar and its feature columns
+        """
+        out = dict(bar)
+        for step in self.steps:
+            step(bar, out)
+        self.rows.append(out)
+        return out
+
+    def warm_up(self, df):
+        """
+        Feeds historical bars through update so live updates continue from the end of df
+        :param df: DataFrame with Close, High, Low and Volume columns
+        :return: None
+        """
+        for bar in df.to_dict('records'):
+            self.update(bar)
+
+    def get_df(self):
+        return pd.DataFrame(self.rows)
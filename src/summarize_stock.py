@@ -2,17 +2,14 @@ import json
 import pandas as pd
 import numpy as np
 import math
+import warnings
 import yaml
-from extract_data import *
-from read_portfolio import *
-from system_check import check_system
-
-# Check the system type to ensure correct paths
-if check_system() == 'macOS':
-    config_path = '/Users/macbook/Mirror/trading_algorithm/config/config_file.yml'
-
-else:
-    config_path = 'C:\\Users\\viren\\DSML projects\\trading_alg\\config\\config_file.yml'
+from extract_data import load_config, construct_urls_frame, get_jsonparsed_data_batch, read_json_frame
+from read_portfolio import read_portfolio
+from price_cache import fetch_with_cache
+import system_check
+import instrumentation
+from instrumentation import profiled, stage
 
 
 def summarize_column(column: pd.Series) -> pd.Series:
@@ -53,9 +50,78 @@ def summarize_column(column: pd.Series) -> pd.Series:
     return pd.Series(summary)
 
 
+def _zero_out_fperr(values):
+    return np.where(np.abs(values) < 1e-14, 0, values)
+
+
+def _moment_stats(count, m2, m3, m4):
+    """
+    Sample std, skewness and excess kurtosis from counts and central moment sums, with pandas' bias corrections
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.where(count > 1, np.sqrt(m2 / (count - 1)), np.nan)
+        m2, m3, m4 = _zero_out_fperr(m2), _zero_out_fperr(m3), _zero_out_fperr(m4)
+        skew = (count * (count - 1) ** 0.5 / (count - 2)) * (m3 / m2**1.5)
+        skew = np.where(count < 3, np.nan, np.where(m2 == 0, 0, skew))
+        numerator = _zero_out_fperr(count * (count + 1) * (count - 1) * m4)
+        denominator = _zero_out_fperr((count - 2) * (count - 3) * m2**2)
+        kurt = numerator / denominator - 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        kurt = np.where(count < 4, np.nan, np.where(denominator == 0, 0, kurt))
+    return std, skew, kurt
+
+
+def _sorted_quantile(ordered, count, q):
+    """
+    Linear interpolated quantile of each row of ordered (NaNs sorted last), matching np.quantile
+    """
+    rows = np.arange(len(ordered))
+    position = q * np.maximum(count - 1, 0)
+    below = np.floor(position).astype(int)
+    above = np.minimum(below + 1, np.maximum(count - 1, 0))
+    t = position - below
+    a, b = ordered[rows, below], ordered[rows, above]
+    diff = b - a
+    value = np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+    return np.where(count > 0, value, np.nan)
+
+
+def _numeric_summary(block: pd.DataFrame) -> dict:
+    """
+    Statistics of every numeric column at once: the moments come from one pass over the centred block, and
+    the quartiles, min, max and unique counts from a single sort of each column
+    :return: (unique counts, dict of statistic name -> array with one value per column)
+    """
+    x = block.to_numpy(dtype=np.float64, na_value=np.nan).T
+    valid = ~np.isnan(x)
+    count = valid.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(valid, x, 0).sum(axis=1) / count
+    centred = np.where(valid, x - mean[:, None], 0)
+    squared = centred * centred
+    std, skew, kurt = _moment_stats(count, squared.sum(axis=1), (squared * centred).sum(axis=1), (squared * squared).sum(axis=1))
+    del centred, squared, valid
+
+    ordered = np.sort(x, axis=1)
+    del x
+    if ordered.shape[1] == 0:
+        ordered = np.full((len(ordered), 1), np.nan)
+    # NaNs sort last, so the valid values of each column are ordered[:, :count]
+    changes = (ordered[:, 1:] != ordered[:, :-1]) & (np.arange(1, ordered.shape[1]) < count[:, None])
+    unique = np.where(count > 0, changes.sum(axis=1) + 1, 0)
+    stats = {'Mean': mean, 'Std Dev': std, 'Min': ordered[:, 0],
+             '25%': _sorted_quantile(ordered, count, 0.25),
+             '50% (Median)': _sorted_quantile(ordered, count, 0.5),
+             '75%': _sorted_quantile(ordered, count, 0.75),
+             'Max': ordered[np.arange(len(ordered)), np.maximum(count - 1, 0)],
+             'Skewness': skew, 'Kurtosis': kurt}
+    return unique, stats
+
+
+@profiled(rows=lambda df: len(df))
 def summarize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     """
     Returns a statistical summary for each column in the given DataFrame.
+    The numeric columns are summarized together as one block rather than column by column.
 
     Parameters:
     df (pd.DataFrame): The DataFrame to summarize
@@ -63,6 +129,10 @@ def summarize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
     pd.DataFrame: Summary statistics for each column
     """
+    numeric = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+    unique, stats = _numeric_summary(df[numeric]) if numeric else ([], {})
+    non_null = df.count()
+    position = {col: i for i, col in enumerate(numeric)}
     summaries = []
 
     for col in df.columns:
@@ -72,22 +142,15 @@ def summarize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
         # General info
         summary['Column Name'] = col
         summary['Data Type'] = column.dtype
-        summary['Non-Null Count'] = column.count()
-        summary['Null Count'] = column.isnull().sum()
-        summary['Unique Count'] = column.nunique()
-
-        if pd.api.types.is_numeric_dtype(column):
+        summary['Non-Null Count'] = non_null[col]
+        summary['Null Count'] = len(column) - non_null[col]
+        if col in position:
+            summary['Unique Count'] = unique[position[col]]
             # Numeric statistics
-            summary['Mean'] = column.mean()
-            summary['Std Dev'] = column.std()
-            summary['Min'] = column.min()
-            summary['25%'] = column.quantile(0.25)
-            summary['50% (Median)'] = column.median()
-            summary['75%'] = column.quantile(0.75)
-            summary['Max'] = column.max()
-            summary['Skewness'] = column.skew()
-            summary['Kurtosis'] = column.kurt()
+            for name, values in stats.items():
+                summary[name] = values[position[col]]
         else:
+            summary['Unique Count'] = column.nunique()
             # Categorical/text statistics
             mode = column.mode()
             summary['Top (Most Frequent)'] = mode.iloc[0] if not mode.empty else None
@@ -100,31 +163,209 @@ def summarize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     return pd.DataFrame(summaries).set_index('Column Name')
 
 
-def summarize_stock(portfolio_path, by_column: bool=False):
+class QuantileSketch:
+    '''Mergeable approximate quantile sketch: a stack of compactors where level h holds values of weight 2**h.
+    A full level is sorted and every other value (from a random offset) moves up a level, which keeps the
+    rank error around 1/capacity with O(capacity * log(n)) memory.'''
+
+    def __init__(self, capacity: int=256, seed: int=0):
+        self.capacity = capacity
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) > self.capacity:
+                ordered = np.sort(self.levels[h])
+                if len(ordered) % 2:
+                    # keep one value back so the promoted half has exactly half the weight
+                    self.levels[h], ordered = ordered[-1:], ordered[:-1]
+                else:
+                    self.levels[h] = np.empty(0)
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], ordered[self.rng.integers(2)::2]])
+            h += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        self.levels[0] = np.concatenate([self.levels[0], values[~np.isnan(values)]])
+        self._compact()
+
+    def merge(self, other):
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self._compact()
+
+    def quantile(self, q):
+        values = np.concatenate(self.levels)
+        if not len(values):
+            return np.nan
+        weights = np.concatenate([np.full(len(level), 2.0**h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        return values[order][min(np.searchsorted(cumulative, q * cumulative[-1]), len(values) - 1)]
+
+
+class StreamingSummary:
+    '''Chunked version of summarize_dataframe for data that does not fit in memory. Each chunk is reduced to
+    per column counts, min/max and central moment sums, which are merged exactly, plus a QuantileSketch
+    for approximate quartiles. Unique counts are not mergeable and are left empty.
+
+    Methods:
+        update(chunk): Adds a DataFrame chunk.
+        merge(other): Adds the state of another StreamingSummary, e.g. from another worker.
+        summary(): Returns the summary DataFrame in the layout of summarize_dataframe.
+        '''
+
+    def __init__(self, capacity: int=256):
+        self.capacity = capacity
+        self.columns = {}
+
+    def _state(self, col, dtype):
+        if col not in self.columns:
+            self.columns[col] = {'dtype': dtype, 'rows': 0, 'n': 0.0, 'mean': 0.0, 'm2': 0.0, 'm3': 0.0, 'm4': 0.0,
+                                 'min': np.nan, 'max': np.nan, 'sketch': QuantileSketch(self.capacity)}
+        return self.columns[col]
+
+    @staticmethod
+    def _combine(a, b):
+        """
+        Merges the count and central moment sums of b into a (Pebay's pairwise update)
+        """
+        na, nb = a['n'], b['n']
+        if nb == 0:
+            return
+        if na == 0:
+            a.update({key: b[key] for key in ['n', 'mean', 'm2', 'm3', 'm4']})
+            return
+        n = na + nb
+        delta = b['mean'] - a['mean']
+        m2 = a['m2'] + b['m2'] + delta**2 * na * nb / n
+        m3 = (a['m3'] + b['m3'] + delta**3 * na * nb * (na - nb) / n**2
+              + 3 * delta * (na * b['m2'] - nb * a['m2']) / n)
+        m4 = (a['m4'] + b['m4'] + delta**4 * na * nb * (na**2 - na * nb + nb**2) / n**3
+              + 6 * delta**2 * (na**2 * b['m2'] + nb**2 * a['m2']) / n**2
+              + 4 * delta * (na * b['m3'] - nb * a['m3']) / n)
+        a.update({'n': n, 'mean': a['mean'] + delta * nb / n, 'm2': m2, 'm3': m3, 'm4': m4})
+
+    def update(self, chunk: pd.DataFrame):
+        numeric = [col for col in chunk.columns if pd.api.types.is_numeric_dtype(chunk[col])]
+        non_null = chunk.count()
+        for col in chunk.columns:
+            state = self._state(col, chunk[col].dtype)
+            state['rows'] += len(chunk)
+            if col not in numeric:
+                state['n'] += non_null[col]
+        if not numeric:
+            return
+
+        x = chunk[numeric].to_numpy(dtype=np.float64, na_value=np.nan).T
+        valid = ~np.isnan(x)
+        count = valid.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(valid, x, 0).sum(axis=1) / count
+        centred = np.where(valid, x - mean[:, None], 0)
+        squared = centred * centred
+        m2, m3, m4 = squared.sum(axis=1), (squared * centred).sum(axis=1), (squared * squared).sum(axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            minimum, maximum = np.nanmin(x, axis=1), np.nanmax(x, axis=1)
+
+        for i, col in enumerate(numeric):
+            state = self.columns[col]
+            self._combine(state, {'n': float(count[i]), 'mean': mean[i], 'm2': m2[i], 'm3': m3[i], 'm4': m4[i]})
+            state['min'] = np.fmin(state['min'], minimum[i])
+            state['max'] = np.fmax(state['max'], maximum[i])
+            state['sketch'].update(x[i])
+
+    def merge(self, other):
+        for col, theirs in other.columns.items():
+            state = self._state(col, theirs['dtype'])
+            state['rows'] += theirs['rows']
+            if pd.api.types.is_numeric_dtype(theirs['dtype']):
+                self._combine(state, theirs)
+                state['min'] = np.fmin(state['min'], theirs['min'])
+                state['max'] = np.fmax(state['max'], theirs['max'])
+                state['sketch'].merge(theirs['sketch'])
+            else:
+                state['n'] += theirs['n']
+
+    def summary(self) -> pd.DataFrame:
+        numeric = [col for col, state in self.columns.items() if pd.api.types.is_numeric_dtype(state['dtype'])]
+        count = np.array([self.columns[col]['n'] for col in numeric])
+        std, skew, kurt = _moment_stats(count, *[np.array([self.columns[col][key] for col in numeric]) for key in ['m2', 'm3', 'm4']])
+        summaries = []
+        for col, state in self.columns.items():
+            summary = {'Column Name': col, 'Data Type': state['dtype'], 'Non-Null Count': int(state['n']),
+                       'Null Count': state['rows'] - int(state['n']), 'Unique Count': np.nan}
+            if col in numeric:
+                i = numeric.index(col)
+                sketch = state['sketch']
+                summary.update({'Mean': state['mean'] if state['n'] else np.nan, 'Std Dev': std[i], 'Min': state['min'],
+                                '25%': sketch.quantile(0.25), '50% (Median)': sketch.quantile(0.5),
+                                '75%': sketch.quantile(0.75), 'Max': state['max'],
+                                'Skewness': skew[i], 'Kurtosis': kurt[i]})
+            summaries.append(summary)
+        return pd.DataFrame(summaries).set_index('Column Name')
+
+
+@profiled()
+def summarize_chunks(chunks) -> pd.DataFrame:
+    """
+    Returns summarize_dataframe style statistics for data read in chunks, e.g. pd.read_csv(path, chunksize=100000).
+    Moments, counts, min and max are exact; the quartiles are approximate and the unique counts are left empty.
+
+    Parameters:
+    chunks (iterable): DataFrames with the same columns
+
+    Returns:
+    pd.DataFrame: Summary statistics for each column
+    """
+    streaming = StreamingSummary()
+    for chunk in chunks:
+        streaming.update(chunk)
+    return streaming.summary()
+
+
+def summarize_stock(portfolio_path, by_column: bool=False, max_workers: int=8, rate_limit: float=None, cache_dir: str=None,
+                    config_path: str=None):
+    # the config comes from the argument, the TRADING_CONFIG environment variable or the project's config folder
+    config_path = system_check.config_path(config_path)
     portfolio_df = read_portfolio(portfolio_path)
 
-    with open(config_path,'r') as file:
-        config = yaml.safe_load(file)
+    config = load_config(config_path)
+    instrumentation.configure(config_path)
 
     key_name = 'stock_key'
     # api_key = config['keys'][key_name]
 
-    for i in portfolio_df['stock_name']:
-        current_stock = portfolio_df[portfolio_df['stock_name']==i]
-
-        current_url = construct_urls(config_path=config_path,
-                                    key_name=key_name,
-                                    data_freq=str((current_stock[config['columns']['freq']]).values[0]),
-                                    fromdate=current_stock[config['columns']['from']].values[0],
-                                    todate=current_stock[config['columns']['to']].values[0],
-                                    symbol=current_stock[config['columns']['stock_symbol']].values[0])
-        
-        print('URL constructed for:',current_stock[config['columns']['stock_symbol']].values[0])
-        
+    columns = config['columns']
+    requests = list(zip(portfolio_df[columns['stock_symbol']],
+                        portfolio_df[columns['freq']].astype(str),
+                        portfolio_df[columns['from']],
+                        portfolio_df[columns['to']]))
+
+    if cache_dir is None:
+        urls = construct_urls_frame(portfolio_df, config_path, key_name).tolist()
+        print('URLs constructed for:', ', '.join(str(request[0]) for request in requests))
+
+    with stage('fetch_all', symbols=len(requests), cached=cache_dir is not None):
+        if cache_dir is None:
+            outputs = get_jsonparsed_data_batch(urls, max_workers=max_workers, rate_limit=rate_limit, parser=read_json_frame)
+        else:
+            frames = fetch_with_cache(requests, config_path, key_name, cache_dir, max_workers=max_workers, rate_limit=rate_limit)
+            outputs = [(r[0], f) if f is not None else None for r, f in zip(requests, frames)]
+
+    for i, output in zip(portfolio_df['stock_name'], outputs):
         try:
-            json_data_output = get_jsonparsed_data(current_url)
+            if output is None:
+                raise ValueError
             print('Data fetched for:', i)
-            symbol, data = read_json_data(json_data_output)
+            symbol, data = output
             print('Current Stock:', symbol)
             print(data.head(10))
             print('Data Summary:')
@@ -149,6 +390,9 @@ def summarize_stock(portfolio_path, by_column: bool=False):
             print('Error fetching data for:',i)
             continue
 
+    if instrumentation.ENABLED:
+        print('Profiling report written to:', instrumentation.write_report())
+
 
 if __name__ == '__main__':
-    summarize_stock(portfolio_path='C:\\Users\\viren\\DSML projects\\trading_alg\\portfolio.csv')
\ No newline at end of file
+    summarize_stock(portfolio_path=system_check.portfolio_path())
\ No newline at end of file
@@ -1,10 +1,53 @@
+import os
 import sys
 
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+LEGACY_PATHS = {'macOS': '/Users/macbook/Mirror/trading_algorithm',
+                'win': 'C:\\Users\\viren\\DSML projects\\trading_alg'}
+
+
 def check_system():
     if sys.platform == 'darwin':
         return 'macOS'
+    elif sys.platform.startswith('linux'):
+        return 'linux'
     else:
         return 'win'
 
+
+def resolve_path(path: str=None, env_var: str=None, relative: str=None):
+    """
+    Finds a project file: an explicit path wins, then the environment variable, then the old per-machine
+    location when it exists, then the file in this checkout
+    :param path: explicit path, e.g. from a command line argument
+    :param env_var: environment variable holding the path
+    :param relative: location inside the project, e.g. 'config/config_file.yml'
+    :return: the path
+    """
+    if path:
+        return path
+    if env_var and os.environ.get(env_var):
+        return os.environ[env_var]
+    legacy = LEGACY_PATHS.get(check_system())
+    if legacy is not None and os.path.exists(os.path.join(legacy, relative)):
+        return os.path.join(legacy, relative)
+    return os.path.join(REPO_DIR, relative)
+
+
+def config_path(path: str=None):
+    """
+    Path of config_file.yml, overridable with the TRADING_CONFIG environment variable
+    """
+    return resolve_path(path, 'TRADING_CONFIG', os.path.join('config', 'config_file.yml'))
+
+
+def portfolio_path(path: str=None):
+    """
+    Path of portfolio.csv, overridable with the TRADING_PORTFOLIO environment variable
+    """
+    return resolve_path(path, 'TRADING_PORTFOLIO', 'portfolio.csv')
+
+
 if __name__ == "__main__":
-    print(check_system())
\ No newline at end of file
+    print(check_system())
+    print(config_path())
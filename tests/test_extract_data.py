@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+from extract_data import get_jsonparsed_data_batch
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Answers /<status>?symbol=X with {"symbol": X}; /flaky fails with 500 for the first `fail` requests'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        symbol = parse_qs(parts.query)['symbol'][0]
+        with server.lock:
+            server.log.append((time.monotonic(), self.client_address, parts.path, symbol))
+            server.hits[symbol] = server.hits.get(symbol, 0) + 1
+            hits = server.hits[symbol]
+        if parts.path == '/flaky':
+            status = 500 if hits <= server.fail else 200
+        elif parts.path == '/ok':
+            status = 200
+        else:
+            status = int(parts.path[1:])
+        # later symbols answer faster, so completion order differs from input order
+        time.sleep(server.delay.get(symbol, 0))
+        body = json.dumps({'symbol': symbol}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.lock = threading.Lock()
+    server.log, server.hits, server.delay, server.fail = [], {}, {}, 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_results_keep_input_order(server):
+    symbols = [f'S{i}' for i in range(8)]
+    server.delay = {symbol: 0.05*(8 - i) for i, symbol in enumerate(symbols)}
+    urls = [f'{server.url}/ok?symbol={symbol}&apikey=k' for symbol in symbols]
+    results = get_jsonparsed_data_batch(urls, max_workers=4)
+    assert [result['symbol'] for result in results] == symbols
+
+
+def test_connections_are_reused(server):
+    urls = [f'{server.url}/ok?symbol=S{i}&apikey=k' for i in range(20)]
+    results = get_jsonparsed_data_batch(urls, max_workers=2)
+    assert all(result is not None for result in results)
+    # one keep-alive connection per worker thread
+    assert len({client for _, client, _, _ in server.log}) <= 2
+
+
+def test_retries_server_errors_with_backoff(server):
+    server.fail = 2
+    start = time.monotonic()
+    results = get_jsonparsed_data_batch([f'{server.url}/flaky?symbol=A&apikey=k'], retries=3, backoff=0.1)
+    assert results == [{'symbol': 'A'}]
+    assert server.hits['A'] == 3
+    # slept 0.1 + 0.2 seconds between the attempts
+    assert time.monotonic() - start >= 0.3
+    times = [logged for logged, *_ in server.log]
+    assert times[2] - times[1] >= 0.2 > times[1] - times[0] >= 0.1
+
+
+@pytest.mark.parametrize('status, attempts', [(404, 1), (401, 1), (429, 3), (503, 3)])
+def test_client_errors_fail_fast(server, status, attempts):
+    results = get_jsonparsed_data_batch([f'{server.url}/{status}?symbol=A&apikey=k'], retries=2, backoff=0.01)
+    assert results == [None]
+    assert server.hits['A'] == attempts
+
+
+def test_rate_limit_spaces_requests_per_key(server):
+    urls = [f'{server.url}/ok?symbol=S{i}&apikey=k' for i in range(5)]
+    get_jsonparsed_data_batch(urls, max_workers=5, rate_limit=10)
+    times = sorted(logged for logged, *_ in server.log)
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.09
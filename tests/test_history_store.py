@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+from history_store import HistoryStore, write_history
+from indicator import Indicator
+
+
+def _bars(rows, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, rows))
+    # FMP names and newest first, as the api returns them
+    return pd.DataFrame({'date': pd.date_range('2024-01-01', periods=rows, freq='D'), 'open': close,
+                         'high': close + 1, 'low': close - 1, 'close': close,
+                         'volume': rng.integers(1, 1000, rows).astype(float)}).iloc[::-1]
+
+
+def test_indicator_runs_on_memory_mapped_frame(tmp_path):
+    frames = {'AAPL': _bars(300, 0), 'MSFT': _bars(200, 1)}
+    write_history(str(tmp_path), frames)
+    store = HistoryStore(str(tmp_path))
+
+    frame = store.frame('MSFT')
+    assert list(frame.columns) == ['Open', 'High', 'Low', 'Close', 'Volume']
+    indicator = Indicator(frame)
+    indicator.sma(20)
+    indicator.rsi(14)
+    assert np.shares_memory(indicator.df['Close'].to_numpy(), store._map('Close'))
+
+    expected = Indicator(frames['MSFT'].rename(columns=str.title).sort_values('Date').set_index('Date'))
+    expected.sma(20)
+    expected.rsi(14)
+    for column in ['sma_20', 'rsi_14']:
+        np.testing.assert_allclose(indicator.df[column].to_numpy(), expected.df[column].to_numpy())
+
+
+def test_date_range_slices(tmp_path):
+    write_history(str(tmp_path), {'AAPL': _bars(300, 0)})
+    frame = HistoryStore(str(tmp_path)).frame('AAPL', start='2024-02-01', end='2024-02-29')
+    assert len(frame) == 29
+    assert frame.index[0] == pd.Timestamp('2024-02-01') and frame.index.is_monotonic_increasing
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+import pytest
+from live_ingest import LiveIngestor
+
+TIMES = pd.date_range('2025-01-02 09:30', periods=7, freq='1min')
+# each poll overlaps the previous one and the second repeats a bar within the payload
+POLLS = [[0, 1, 2, 3, 4], [3, 4, 5, 5, 6], [6]]
+
+
+class PollHandler(BaseHTTPRequestHandler):
+    '''Serves the scripted polls per symbol, then empty payloads'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        symbol = query['symbol'][0]
+        with self.server.lock:
+            self.server.queries.setdefault(symbol, []).append(query)
+            poll = len(self.server.queries[symbol]) - 1
+        offset = 100 if symbol == 'MSFT' else 0
+        rows = POLLS[poll] if poll < len(POLLS) else []
+        body = json.dumps([{'date': TIMES[i].strftime('%Y-%m-%d %H:%M:%S'), 'open': i + offset, 'high': i + offset + 1,
+                            'low': i + offset - 1, 'close': i + offset, 'volume': 10} for i in rows]).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def config(tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PollHandler)
+    server.lock = threading.Lock()
+    server.queries = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    path = tmp_path / 'config.yml'
+    path.write_text(f"requests:\n 1min: 'http://127.0.0.1:{server.server_port}/chart?symbol={{symbol}}"
+                    f"&from={{from_date}}&to={{to_date}}&apikey={{key}}'\nkeys:\n  stock_key: k\n")
+    yield str(path), server.queries
+    server.shutdown()
+    server.server_close()
+
+
+def test_polls_deliver_each_bar_once(config):
+    config_path, queries = config
+    delivered = []
+    ingestor = LiveIngestor(['AAPL', 'MSFT'], '1min', config_path, 'stock_key', indicators=[('sma', 3)],
+                            poll_interval=0.05, queue_size=2,
+                            on_features=lambda symbol, features: delivered.append((symbol, features)))
+    report = asyncio.run(ingestor.run(duration=0.6))
+
+    for symbol, offset in [('AAPL', 0), ('MSFT', 100)]:
+        assert len(queries[symbol]) > len(POLLS)
+        closes = [features['Close'] for name, features in delivered if name == symbol]
+        assert closes == [i + offset for i in range(7)]
+        assert ingestor.cursors[symbol] == TIMES[-1]
+        assert report.loc[symbol, 'new_bars'] == 7
+        # 3 old or repeated bars in the second poll, 1 in the third
+        assert report.loc[symbol, 'duplicates'] == 4
+        assert report.loc[symbol, 'errors'] == 0
+        # later polls ask for the cursor's day only
+        assert queries[symbol][1]['from'] == [TIMES[0].strftime('%Y-%m-%d')]
+
+    sma = [features['sma_3'] for name, features in delivered if name == 'AAPL']
+    assert sma[-1] == pytest.approx(5.0)
+    # live indicators keep no history by default
+    assert len(ingestor.indicators['AAPL'].get_df()) == 0
+
+
+def test_failing_callback_does_not_stop_ingestion(config):
+    config_path, queries = config
+    delivered = []
+
+    def on_features(symbol, features):
+        if features['Close'] == 2:
+            raise RuntimeError('callback failed')
+        delivered.append(features['Close'])
+
+    ingestor = LiveIngestor(['AAPL'], '1min', config_path, 'stock_key', poll_interval=0.05, queue_size=1,
+                            on_features=on_features)
+    report = asyncio.run(asyncio.wait_for(ingestor.run(duration=0.4), timeout=5))
+    assert delivered == [0, 1, 3, 4, 5, 6]
+    assert report.loc['AAPL', 'errors'] == 1
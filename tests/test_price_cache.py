@@ -0,0 +1,71 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pandas as pd
+import pytest
+from price_cache import fetch_with_cache
+
+DAYS = pd.date_range('2024-01-01', '2024-03-31', freq='D')
+
+
+class BarsHandler(BaseHTTPRequestHandler):
+    '''Serves daily bars as a list payload; honours from/to when the url has them'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        self.server.requests.append(query)
+        days = DAYS
+        if 'from' in query:
+            days = days[(days >= query['from'][0]) & (days <= query['to'][0])]
+        body = json.dumps([{'symbol': 'AAPL', 'date': day.strftime('%Y-%m-%d'), 'price': float(i), 'volume': 1}
+                           for i, day in enumerate(days)]).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def config(tmp_path):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BarsHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/bars?symbol={{symbol}}'
+    path = tmp_path / 'config.yml'
+    path.write_text(f"requests:\n dated: '{url}&from={{from_date}}&to={{to_date}}&apikey={{key}}'\n"
+                    f" full: '{url}&apikey={{key}}'\nkeys:\n  stock_key: k\n")
+    yield str(path), server.requests, str(tmp_path / 'cache')
+    server.shutdown()
+    server.server_close()
+
+
+def test_top_up_requests_only_missing_days(config):
+    config_path, requests, cache_dir = config
+    first = fetch_with_cache([('AAPL', 'dated', '2024-01-10', '2024-01-31')], config_path, 'stock_key', cache_dir)[0]
+    assert len(first) == 22
+    second = fetch_with_cache([('AAPL', 'dated', '2024-01-10', '2024-02-15')], config_path, 'stock_key', cache_dir)[0]
+    assert len(second) == 37
+    assert requests[-1]['from'] == ['2024-01-31'] and requests[-1]['to'] == ['2024-02-15']
+
+
+def test_template_without_dates_is_not_topped_up(config):
+    config_path, requests, cache_dir = config
+    fetch_with_cache([('AAPL', 'full', '2024-01-10', '2024-01-31')], config_path, 'stock_key', cache_dir)
+    assert len(requests) == 1 and 'from' not in requests[0]
+    # the full payload is cached, so a range inside it needs no request
+    frame = fetch_with_cache([('AAPL', 'full', '2024-02-01', '2024-02-10')], config_path, 'stock_key', cache_dir)[0]
+    assert len(requests) == 1 and len(frame) == 10
+
+
+@pytest.mark.parametrize('fromdate, todate', [(None, '2024-01-31'), ('2024-01-10', None), ('2024-02-01', '2024-01-01')])
+def test_invalid_dates_are_rejected(config, fromdate, todate):
+    config_path, requests, cache_dir = config
+    with pytest.raises(ValueError):
+        fetch_with_cache([('AAPL', 'dated', fromdate, todate)], config_path, 'stock_key', cache_dir)
+    assert not requests